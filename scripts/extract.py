@@ -1,76 +1,237 @@
-import subprocess
+import os
 import sys
-import re
+import mmap
+import zlib
+import struct
+import argparse
 
-from pprint import pprint
+SHT_SYMTAB = 2
+SHT_DYNSYM = 11
+SHT_GNU_VERDEF = 0x6ffffffd
+SHT_GNU_VERSYM = 0x6fffffff
+PT_LOAD = 1
+PT_NOTE = 4
 
-def extract_functions(so_file):
-    try:
-        result = subprocess.run(['readelf', '-Ws', so_file], stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-        if result.returncode != 0:
-            print(f"Error: {result.stderr.strip()}")
-            return
-
-        output = result.stdout
-
-        # Regex patterns to match defined, undefined, and weak functions
-        defined_pattern = re.compile(r'\s+(\d+):\s+([0-9a-fA-F]+)\s+\d+\s+FUNC\s+GLOBAL\s+DEFAULT\s+\d+\s+(\w+)')
-        undefined_pattern = re.compile(r'\s+(\d+):\s+0000000000000000\s+\d+\s+FUNC\s+GLOBAL\s+DEFAULT\s+UND\s+(\w+)')
-        weak_pattern = re.compile(r'\s+(\d+):\s+([0-9a-fA-F]+)\s+\d+\s+FUNC\s+WEAK\s+DEFAULT\s+\d+\s+(\w+)')
-
-        defined_functions = []
-        undefined_functions = []
-        weak_functions = []
-
-        # Parse the output and categorize functions
-        all_function_list_unique = set()
-        for line in output.splitlines():
-            defined_match = defined_pattern.match(line)
-            undefined_match = undefined_pattern.match(line)
-            weak_match = weak_pattern.match(line)
-
-            if defined_match:
-                defined_functions.append((defined_match.group(3), defined_match.group(2)))
-            elif undefined_match:
-                undefined_functions.append(undefined_match.group(2))
-            elif weak_match:
-                weak_functions.append((weak_match.group(3), weak_match.group(2)))
-
-        # Output the list of defined global functions with addresses
-        if defined_functions:
-            for func, addr in defined_functions:
-                all_function_list_unique.add((addr, func))
-        else:
-            print("No defined global functions found.")
-
-        # Output the list of undefined functions (functions dynamically linked at runtime)
-        # if undefined_functions:
-        #     for func in undefined_functions:
-        #         print(f"- {func}")
-        # else:
-        #     print("No undefined functions found.")
-
-        # Output the list of weak functions with addresses
-        # if weak_functions:
-        #     for func, addr in weak_functions:
-        #         all_function_list_unique.add((addr, func))
-        # else:
-        #     print("No weak functions found.")
-
-        pprint(all_function_list_unique)
-        index = 1
-        with open("library_functions.txt", "w") as fp:
-            for item in all_function_list_unique:
-                fp.write(f"{item[1]} {index}\n")
-                index +=1
-    except Exception as e:
-        print(f"Error: {str(e)}")
+STT_FUNC = 2
+STT_GNU_IFUNC = 10
+STB_GLOBAL = 1
+STB_WEAK = 2
+BIND_NAMES = {STB_GLOBAL: "GLOBAL", STB_WEAK: "WEAK"}
+STV_DEFAULT = 0
+STV_PROTECTED = 3
+VERSYM_HIDDEN = 0x8000
+
+# Function IDs are passed to dummy() as a positive int, 0 means unknown
+ID_MASK = 0x7fffffff
+
+
+class ELFFile:
+    """Memory-mapped ELF64 file, only what is needed to list exported functions."""
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as fp:
+            self.data = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.data[:4] != b"\x7fELF" or self.data[4] != 2:
+            raise ValueError(f"{path} is not an ELF64 file")
+        self.endian = "<" if self.data[5] == 1 else ">"
+        phoff, shoff = self.unpack("QQ", 32)
+        phentsize, phnum, shentsize, shnum, shstrndx = self.unpack("HHHHH", 54)
+        # (sh_type, sh_link, sh_offset, sh_size, sh_entsize) of every section
+        self.sections = []
+        for i in range(shnum):
+            _, sh_type, _, _, sh_offset, sh_size, sh_link, _, _, sh_entsize = self.unpack("IIQQQQIIQQ", shoff + i * shentsize)
+            self.sections.append((sh_type, sh_link, sh_offset, sh_size, sh_entsize))
+        self.segments = []
+        for i in range(phnum):
+            p_type, _, p_offset, p_vaddr, _, p_filesz = self.unpack("IIQQQQ", phoff + i * phentsize)
+            self.segments.append((p_type, p_offset, p_vaddr, p_filesz))
+
+    def unpack(self, fmt, offset):
+        return struct.unpack_from(self.endian + fmt, self.data, offset)
+
+    def string(self, strtab_index, offset):
+        start = self.sections[strtab_index][2] + offset
+        return self.data[start:self.data.find(b"\0", start)].decode()
+
+    def build_id(self):
+        for p_type, p_offset, _, p_filesz in self.segments:
+            if p_type != PT_NOTE:
+                continue
+            pos, end = p_offset, p_offset + p_filesz
+            while pos + 12 <= end:
+                namesz, descsz, n_type = self.unpack("III", pos)
+                name_end = pos + 12 + ((namesz + 3) & ~3)
+                if n_type == 3 and self.data[pos + 12:pos + 12 + namesz].rstrip(b"\0") == b"GNU":
+                    return self.data[name_end:name_end + descsz].hex()
+                pos = name_end + ((descsz + 3) & ~3)
+        return None
+
+    def file_offset(self, vaddr):
+        for p_type, p_offset, p_vaddr, p_filesz in self.segments:
+            if p_type == PT_LOAD and p_vaddr <= vaddr < p_vaddr + p_filesz:
+                return vaddr - p_vaddr + p_offset
+        return None
+
+    def version_names(self):
+        """Map version index to name from .gnu.version_d."""
+        names = {}
+        for sh_type, sh_link, sh_offset, sh_size, _ in self.sections:
+            if sh_type != SHT_GNU_VERDEF:
+                continue
+            pos = sh_offset
+            while True:
+                _, vd_flags, vd_ndx, vd_cnt, _, vd_aux, vd_next = self.unpack("HHHHIII", pos)
+                # the VER_FLG_BASE entry names the file itself, not a version
+                if vd_cnt and not vd_flags & 1:
+                    vda_name, _ = self.unpack("II", pos + vd_aux)
+                    names[vd_ndx] = self.string(sh_link, vda_name)
+                if not vd_next:
+                    break
+                pos += vd_next
+        return names
+
+    def functions(self):
+        """
+        Yield (name, version, default, bind, address, size) for every defined
+        global or weak function in .dynsym and .symtab. version is None for
+        unversioned symbols, default is False for hidden (name@VERSION) ones.
+        """
+        versions = self.version_names()
+        versym = next((s for s in self.sections if s[0] == SHT_GNU_VERSYM), None)
+        for sh_type, sh_link, sh_offset, sh_size, sh_entsize in self.sections:
+            if sh_type not in (SHT_DYNSYM, SHT_SYMTAB) or not sh_entsize:
+                continue
+            for i in range(sh_size // sh_entsize):
+                st_name, st_info, st_other, st_shndx, st_value, st_size = self.unpack("IBBHQQ", sh_offset + i * sh_entsize)
+                bind, sym_type = st_info >> 4, st_info & 0xf
+                if sym_type not in (STT_FUNC, STT_GNU_IFUNC) or bind not in BIND_NAMES or st_shndx == 0:
+                    continue
+                if st_other & 3 not in (STV_DEFAULT, STV_PROTECTED):
+                    continue
+                name = self.string(sh_link, st_name)
+                version, default = None, True
+                if "@" in name:
+                    # .symtab spells versions out in the name
+                    name, _, version = name.partition("@")
+                    default = version.startswith("@")
+                    version = version.lstrip("@")
+                elif sh_type == SHT_DYNSYM and versym:
+                    ndx, = self.unpack("H", versym[2] + 2 * i)
+                    version = versions.get(ndx & ~VERSYM_HIDDEN)
+                    default = not ndx & VERSYM_HIDDEN
+                yield name, version, default, BIND_NAMES[bind], st_value, st_size
+
+
+def symbol_label(name, version, default):
+    """Label of a symbol in the function map, non-default versions keep their name@VERSION alias."""
+    return name if default or version is None else f"{name}@{version}"
+
+
+def assign_ids(labels):
+    """
+    Hash each label to a stable ID, so adding or removing functions does not
+    renumber the others. Collisions are resolved by probing, in sorted label order.
+    """
+    ids = {}
+    used = set()
+    for label in sorted(labels):
+        func_id = zlib.crc32(label.encode()) & ID_MASK or 1
+        while func_id in used:
+            func_id = func_id % ID_MASK + 1
+        used.add(func_id)
+        ids[label] = func_id
+    return ids
 
-if __name__ == "__main__":
-    if len(sys.argv) != 2:
-        print("Usage: python3 list_functions_with_addresses.py <path_to_so_file>")
-        sys.exit(1)
 
-    so_file = sys.argv[1]
-    extract_functions(so_file)
+def canonical_label(aliases):
+    """Label that names an alias group: public before __internal, default version, shortest, then sorted."""
+    return min(aliases, key=lambda label: (label.startswith("_"), "@" in label, len(label), label))
 
+
+def alias_groups(libraries):
+    """
+    Group labels defined at the same address of one library (read/__read,
+    open/open64), merging groups that share a label across libraries.
+    Returns {label: canonical label}.
+    """
+    parent = {}
+
+    def find(label):
+        parent.setdefault(label, label)
+        while parent[label] != label:
+            parent[label] = parent[parent[label]]
+            label = parent[label]
+        return label
+
+    for _, _, rows in libraries:
+        first_at = {}
+        for address, _, _, _, label in rows:
+            root = find(label)
+            if address in first_at:
+                parent[root] = find(first_at[address])
+            else:
+                first_at[address] = label
+    groups = {}
+    for label in parent:
+        groups.setdefault(find(label), []).append(label)
+    return {label: canonical_label(aliases) for aliases in groups.values() for label in aliases}
+
+
+def extract_functions(so_files):
+    """
+    Return the function ID map and the index rows (library, build id, rows)
+    of every library. Aliases get the ID of their group's canonical label, so
+    a dummy() announcing any of them matches the one probe at their address.
+    """
+    libraries = []
+    for so_file in so_files:
+        elf = ELFFile(so_file)
+        rows = {}
+        for name, version, default, bind, address, size in elf.functions():
+            label = symbol_label(name, version, default)
+            # .dynsym and .symtab list the same symbol twice, keep one row per label and address
+            rows[(address, label)] = (address, elf.file_offset(address), size, bind, label)
+        libraries.append((os.path.realpath(so_file), elf.build_id(), sorted(rows.values())))
+    canonical = alias_groups(libraries)
+    ids = assign_ids(set(canonical.values()))
+    return {label: ids[canon] for label, canon in canonical.items()}, libraries
+
+
+def write_function_map(path, ids):
+    with open(path, "w") as fp:
+        for label in sorted(ids):
+            fp.write(f"{label} {ids[label]}\n")
+
+
+def write_index(path, ids, libraries):
+    """
+    Address-sorted symbol index: a "# library <path> <build id>" line per
+    library followed by "<vaddr> <file offset> <size> <bind> <name> <id>" rows,
+    addresses in hex, "-" for a symbol outside the loadable segments. The tracer reads it to attach probes by offset.
+    """
+    with open(path, "w") as fp:
+        for library, build_id, rows in libraries:
+            fp.write(f"# library {library} {build_id or '-'}\n")
+            for address, offset, size, bind, label in rows:
+                offset = "-" if offset is None else f"{offset:x}"
+                fp.write(f"{address:x} {offset} {size:x} {bind} {label} {ids[label]}\n")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="List the exported functions of shared libraries with stable function IDs")
+    parser.add_argument("so_files", nargs="+", help="Shared libraries to read (e.g. /lib/x86_64-linux-gnu/libc.so.6).")
+    parser.add_argument("--output", type=str, default="library_functions.txt", help="Function map to write (default: library_functions.txt).")
+    parser.add_argument("--index", type=str, default="library_functions.idx",
+                        help="Address-sorted symbol index to write (default: library_functions.idx).")
+    args = parser.parse_args()
+
+    try:
+        ids, libraries = extract_functions(args.so_files)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    write_function_map(args.output, ids)
+    write_index(args.index, ids, libraries)
+    for library, build_id, rows in libraries:
+        print(f"{library}: {len(rows)} functions")
+    print(f"Wrote {len(set(ids.values()))} function IDs for {len(ids)} names to {args.output}")
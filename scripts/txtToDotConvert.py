@@ -1,7 +1,22 @@
 import os
-from collections import namedtuple
+import json
+import struct
+import hashlib
+import argparse
+from collections import namedtuple, deque
 from pprint import pprint
 
+# Compiled policy format, keep in sync with source/eBPF/policy_format.py
+POLICY_MAGIC = b"NFAPOLCY"
+POLICY_VERSION = 3
+POLICY_HEADER = struct.Struct("<8sIIIIIIIIIII")
+POLICY_FLAG_ELIDED = 1
+# graph attribute marking a DOT policy whose redundant dummy() sites were elided
+DOT_ELIDED = 'comment="elided-dummies"'
+
+# bump when reduction/minimization output changes so cached functions are rebuilt
+BUILD_CACHE_VERSION = 3
+
 
 Edge = namedtuple("Edge", ["node", "edge"])
 
@@ -50,52 +65,190 @@ class Graph():
                 yield node, edge.node, edge.edge
 
     def removeLoop(self):
-        degree = {}
-        for node in self._nodes:
-            degree[node] = [set(), set()]
-        
-        # incomming = {(from, edge), ...} [0]
-        # outgoing = {edge, ...}          [1]
+        incoming = {node: set() for node in self._nodes}
         for node in self._nodes:
             for e in self._graph[node]:
-                degree[node][1].add(e)
-                degree[e.node][0].add((node, e))
-        
-        # loop till we have these kind of nodes (indegree == outDegree == 1) and any one edge(incomming and outgoing) is "e" 
-        # 1) -e- N -e-
-        # 2) -call- N -e-
-        # 3) -e- N -call-
-        isReduced = True
-        while isReduced:
-            isReduced = False
-            node, inDeg, outDeg = None, None, None
-            src, node, e1, e2 = None, None, None, None
-            for _node, (_inDeg, _outDeg) in degree.items():
-                if len(_inDeg) == len(_outDeg) == 1:
-                    for (_src, _e1), _e2 in zip(_inDeg, _outDeg):
-                        if _e1.edge == "e" or _e2.edge == "e":
-                            src, node, e1, e2 = _src, _node, _e1, _e2
-            
-            if node is not None:
-                isReduced = True
-                self.removeEdge(src, e1)
-                self.removeEdge(node, e2)
-                edge = None
-                if e1.edge == e2.edge == "e":
-                    edge = self.addEdge(src, e2.node, "e")
-                elif e1.edge == "e":
-                    edge = self.addEdge(src, e2.node, e2.edge)
-                elif e2.edge == "e":
-                    edge = self.addEdge(src, e2.node, e1.edge)
-
-                # merge  S -e- N -e- D => S -e- D
-                # merge  S -f- N -e- D => S -f- D
-                # merge  S -e- N -f- D => S -f- D
-                degree.pop(node)
-                degree[e2.node][0].remove((node, e2))
-                degree[src][1].remove(e1)
-                degree[src][1].add(edge)
-                degree[e2.node][0].add((src, edge))                    
+                incoming[e.node].add((node, e))
+
+        # worklist of nodes whose neighbourhood changed, each reduction removes one node
+        # 1) S -e- N -f- D...  (N has a single incoming edge, which is "e") => S -f- D...
+        # 2) S... -f- N -e- D  (N has a single outgoing edge, which is "e") => S... -f- D
+        worklist = list(self._nodes)
+        queued = set(worklist)
+        while worklist:
+            node = worklist.pop()
+            queued.discard(node)
+            if node not in self._graph or node == self._start or node == self._end:
+                continue
+
+            inDeg, outDeg = incoming[node], self._graph[node]
+            touched = None
+            if len(inDeg) == 1:
+                (src, e1), = inDeg
+                if e1.edge == "e" and src != node:
+                    self.removeEdge(src, e1)
+                    for e2 in outDeg:
+                        incoming[e2.node].discard((node, e2))
+                        edge = self.addEdge(src, e2.node, e2.edge)
+                        incoming[e2.node].add((src, edge))
+                    touched = {src} | {e2.node for e2 in outDeg}
+            if touched is None and len(outDeg) == 1:
+                e2, = outDeg
+                if e2.edge == "e" and e2.node != node:
+                    incoming[e2.node].discard((node, e2))
+                    for src, e1 in inDeg:
+                        self.removeEdge(src, e1)
+                        edge = self.addEdge(src, e2.node, e1.edge)
+                        incoming[e2.node].add((src, edge))
+                    touched = {src for src, _ in inDeg} | {e2.node}
+
+            if touched is not None:
+                self._graph.pop(node)
+                self._nodes.discard(node)
+                incoming.pop(node)
+                for n in touched:
+                    if n not in queued:
+                        queued.add(n)
+                        worklist.append(n)
+
+    def epsilonClosure(self, node, closures):
+        if node in closures:
+            return closures[node]
+        reached = {node}
+        stack = [node]
+        while stack:
+            curr = stack.pop()
+            for e in self._graph[curr]:
+                if e.edge == "e" and e.node not in reached:
+                    reached.add(e.node)
+                    stack.append(e.node)
+        closures[node] = reached
+        return reached
+
+    def removeEpsilon(self):
+        # S -e-* Q -f- D => S -f- D, nodes reaching the end through "e" keep a single "e" edge to it
+        closures = {}
+        graph = {node: set() for node in self._nodes}
+        for node in self._nodes:
+            closure = self.epsilonClosure(node, closures)
+            for q in closure:
+                for e in self._graph[q]:
+                    if e.edge != "e":
+                        graph[node].add(Edge(e.node, e.edge))
+            if node != self._end and self._end in closure:
+                graph[node].add(Edge(self._end, "e"))
+
+        reachable = {self._start, self._end}
+        stack = [self._start]
+        while stack:
+            curr = stack.pop()
+            for e in graph[curr]:
+                if e.node not in reachable:
+                    reachable.add(e.node)
+                    stack.append(e.node)
+        self._graph = {node: edges for node, edges in graph.items() if node in reachable}
+        self._nodes = set(self._graph)
+
+    def mergeEquivalent(self):
+        # partition refinement: nodes with the same labelled successor blocks are merged,
+        # start and end stay in blocks of their own so call/return linking still finds them
+        block = {node: 0 if node == self._start else 1 if node == self._end else 2 for node in self._nodes}
+        numBlocks = len(set(block.values()))
+        while True:
+            signatures = {}
+            newBlock = {}
+            for node in self._nodes:
+                sig = (block[node], frozenset((e.edge, block[e.node]) for e in self._graph[node]))
+                newBlock[node] = signatures.setdefault(sig, len(signatures))
+            block = newBlock
+            if len(signatures) == numBlocks:
+                break
+            numBlocks = len(signatures)
+
+        rep = {}
+        for node in sorted(self._nodes):
+            rep.setdefault(block[node], node)
+        rep[block[self._start]] = self._start
+        rep[block[self._end]] = self._end
+        graph = {}
+        for node, edges in self._graph.items():
+            merged = graph.setdefault(rep[block[node]], set())
+            for e in edges:
+                merged.add(Edge(rep[block[e.node]], e.edge))
+        self._graph = graph
+        self._nodes = set(graph)
+
+    def redundantSites(self, instrumented):
+        """
+        Find the library call edges whose dummy() tells the enforcer nothing
+        and elide them (see elide), one at a time so every check sees the
+        edges elided before it. Works on the raw per-function ENFA, where the
+        node a call edge enters numbers the call site. Returns
+        ((src, dst, label), kind) pairs, kind is one of
+        - forced: every node whose "e" closure holds src can only continue with
+          this call, and none of them can reach the end of the function or be
+          entered from another function (the start, the return sites of calls
+          into the program), so the call is the only way forward
+        - loop: the call leads back, through "e" edges, to its own source, and
+          every call allowed after it (and the end, if it can be reached) is
+          already allowed from every state the enforcer can be in when src is
+          reachable, i.e. from the closure of every node a call edge enters
+          that holds src. Eliding it only loses how often the loop ran: code
+          after the loop stays behind whatever call led into it.
+        """
+        closures = {}
+        for node in self._nodes:
+            self.epsilonClosure(node, closures)
+        holders = {}
+        for node, closure in closures.items():
+            for q in closure:
+                holders.setdefault(q, set()).add(node)
+        entered = {self._start} | {dst for _, dst, label in self.edges() if label != "e" and label not in instrumented}
+        landing = {self._start} | {dst for _, dst, label in self.edges() if label != "e"}
+
+        def exits(closure):
+            return {(q, e) for q in closure for e in self._graph[q] if e.edge != "e"}
+
+        def covered(src, dst):
+            after = closures[dst]
+            allowed = exits(after)
+            for w in holders[src] & landing:
+                if not allowed <= exits(closures[w]) or (self._end in after and self._end not in closures[w]):
+                    return False
+            return True
+
+        sites = []
+        for src, dst, label in sorted(self.edges()):
+            if label not in instrumented:
+                continue
+            site = (src, Edge(dst, label))
+            if all(w not in entered and self._end not in closures[w] and exits(closures[w]) == {site} for w in holders[src]):
+                kind = "forced"
+            elif src in closures[dst] and covered(src, dst):
+                kind = "loop"
+            else:
+                continue
+            sites.append(((src, dst, label), kind))
+            self.elide([(src, dst, label)])
+            # every closure holding src now also holds the closure of dst
+            for w in list(holders[src]):
+                for q in closures[dst] - closures[w]:
+                    closures[w].add(q)
+                    holders[q].add(w)
+        return sites
+
+    def elide(self, sites):
+        """Turn the given call edges into "e" edges, their calls are no longer announced."""
+        for src, dst, label in sites:
+            self.removeEdge(src, Edge(dst, label))
+            self.addEdge(src, dst, "e")
+
+    def minimize(self):
+        self.removeEpsilon()
+        self.mergeEquivalent()
+
+    def stats(self):
+        return len(self._nodes), sum(len(edges) for edges in self._graph.values())
 
     def print(self):
         pprint(self._graph)
@@ -120,7 +273,8 @@ class Graph():
                 e[1][0]
             )
             # change code here if don't want label over call/return edge just replace it with epsillon
-            self.addEdge(caller, calle, f"call_{f}")
+            # the call edge names its return site, so the enforcer can match each ret_ edge to its call
+            self.addEdge(caller, calle, f"call_{f}@{ret_to}")
             graph_list.get(f).addEdge(ret_from, ret_to, f"ret_{f}")
         return func
                 
@@ -148,39 +302,339 @@ class Graph():
         return graph
 
 
-def exportDOTFormat(graphList, lis,file_name):
-    with open(file_name, "w") as fp:
+def exportDOTFormat(graphList, lis,file_name, elided=False):
+    # written next to the target and renamed over it, a tracer reloading the policy never sees half a file
+    with open(file_name + ".tmp", "w") as fp:
         fp.write("digraph main {\n")
+        if elided:
+            fp.write(f"\t{DOT_ELIDED}\n")
         lis.remove("main")
         graphList.get("main").exportToDot(fp)
         for name in lis:
             graphList.get(name).exportToDot(fp)
         fp.write("}")
+    os.replace(file_name + ".tmp", file_name)
+
+
+def isEpsilonEdge(src, label):
+    """Edges the enforcer steps over without a library call, same rule as Graph.is_epsilon in the enforcer."""
+    return label == "e" or label.startswith("call_") or label.startswith("ret_") or src.split("_")[0] == label
+
+
+def closureTable(epsilon):
+    """
+    Epsilon closures of the nodes 0..n-1 given their epsilon successor lists.
+    Nodes on one epsilon cycle have the same closure, so closures are built
+    once per strongly connected component (iterative Tarjan, successors
+    first). Returns (closure_id per node, closures as sorted node ID lists).
+    """
+    num_nodes = len(epsilon)
+    index, low = [-1] * num_nodes, [0] * num_nodes
+    onStack = [False] * num_nodes
+    closureId = [-1] * num_nodes
+    closures = []
+    stack, counter = [], 0
+    for root in range(num_nodes):
+        if index[root] != -1:
+            continue
+        work = [(root, 0)]
+        while work:
+            node, i = work.pop()
+            if i == 0:
+                index[node] = low[node] = counter
+                counter += 1
+                stack.append(node)
+                onStack[node] = True
+            if i < len(epsilon[node]):
+                work.append((node, i + 1))
+                dst = epsilon[node][i]
+                if index[dst] == -1:
+                    work.append((dst, 0))
+                elif onStack[dst]:
+                    low[node] = min(low[node], index[dst])
+                continue
+            if low[node] == index[node]:
+                members = []
+                while True:
+                    member = stack.pop()
+                    onStack[member] = False
+                    members.append(member)
+                    if member == node:
+                        break
+                reached = set(members)
+                for member in members:
+                    for dst in epsilon[member]:
+                        if closureId[dst] != -1:
+                            reached.update(closures[closureId[dst]])
+                for member in members:
+                    closureId[member] = len(closures)
+                closures.append(sorted(reached))
+            # propagate low to the parent frame
+            if work:
+                parent = work[-1][0]
+                low[parent] = min(low[parent], low[node])
+    return closureId, closures
+
+
+def exportPolicy(graphList, lis, file_name, elided=False):
+    """
+    Write the linked graph as a compiled policy: interned node/label IDs,
+    separate CSR arrays for epsilon and library call edges, the epsilon
+    closure of every node and the start/end states, see source/eBPF/policy_format.py.
+    elided marks a policy whose redundant dummy() sites were elided.
+    """
+    names = ["main"] + [name for name in lis if name != "main"]
+    node_ids, label_ids = {}, {}
+    epsilon, library = [], []
+
+    def intern(table, key):
+        if key not in table:
+            table[key] = len(table)
+            if table is node_ids:
+                epsilon.append([])
+                library.append([])
+        return table[key]
+
+    start = intern(node_ids, graphList.get("main").getStart())
+    for name in names:
+        for src, dst, label in graphList.get(name).edges():
+            src_id = intern(node_ids, src)
+            edges = epsilon if isEpsilonEdge(src, label) else library
+            edges[src_id].append((intern(node_ids, dst), intern(label_ids, label)))
+    ends = [node for node in range(len(node_ids)) if not epsilon[node] and not library[node]]
+    closureId, closures = closureTable([[dst for dst, _ in edges] for edges in epsilon])
+
+    def csr(adjacency):
+        row_ptr, dsts, labels = [0], [], []
+        for edges in adjacency:
+            for dst, label in edges:
+                dsts.append(dst)
+                labels.append(label)
+            row_ptr.append(len(dsts))
+        return row_ptr, dsts, labels
+
+    eps_row_ptr, eps_dst, eps_label = csr(epsilon)
+    lib_row_ptr, lib_dst, lib_label = csr(library)
+    closure_ptr, closure_nodes = [0], []
+    for closure in closures:
+        closure_nodes.extend(closure)
+        closure_ptr.append(len(closure_nodes))
+
+    blob = bytearray()
+    def string_offsets(table):
+        offsets = [len(blob)]
+        for key in table:
+            blob.extend(key.encode())
+            offsets.append(len(blob))
+        return offsets
+    node_name_off = string_offsets(node_ids)
+    label_name_off = string_offsets(label_ids)
+
+    with open(file_name + ".tmp", "wb") as fp:
+        fp.write(POLICY_HEADER.pack(POLICY_MAGIC, POLICY_VERSION, len(node_ids), len(label_ids), len(eps_dst),
+                                    len(lib_dst), start, len(ends), len(closures), len(closure_nodes), len(blob),
+                                    POLICY_FLAG_ELIDED if elided else 0))
+        for array in (eps_row_ptr, eps_dst, eps_label, lib_row_ptr, lib_dst, lib_label, ends,
+                      closureId, closure_ptr, closure_nodes, node_name_off, label_name_off):
+            fp.write(struct.pack(f"<{len(array)}I", *array))
+        fp.write(blob)
+    os.replace(file_name + ".tmp", file_name)
+
+
+def parseENFA(name, lines):
+    graph = Graph(name)
+    graph.setStart(name + "_" + lines[0].strip())
+    graph.setEnd(name + "_" + lines[1].strip())
+    for line in lines[2:]:
+        fname, src, dst, ename = line.strip().split(',')
+        graph.addEdge(name + "_" + src, name + "_" + dst, ename)
+    return graph
+
+
+def readENFAStream(file_name):
+    """
+    Yield (name, lines) per function from a <source>.<path hash>.enfa stream
+    written by CallGraphPass -enfa-stream. After a "# source <path>" line,
+    records are "@ <func> <start> <end> <edge count>" followed by that many
+    edge lines, so only one function is held at a time.
+    """
+    with open(file_name, 'r') as fp:
+        for header in fp:
+            if not header.startswith("@ "):
+                continue
+            _, name, start, end, count = header.split()
+            lines = [start, end]
+            for _ in range(int(count)):
+                lines.append(next(fp).strip())
+            yield name, lines
+
+
+def instrumentedDigest(instrumented):
+    """Cache key part of an --elide-dummies function set, computed once per run."""
+    return hashlib.sha256("\n".join(sorted(instrumented)).encode()).hexdigest() if instrumented else ""
+
+
+def buildFunction(name, lines, minimize, cache_dir, instrumented=None, elideDigest=""):
+    """
+    Parse and reduce one function automaton. Runs in a worker process, the
+    result is cached on disk under the hash of its ENFA text and build options.
+    With instrumented (the functions DummyCallAddPass announces, elideDigest
+    its instrumentedDigest), redundant call sites are found and elided first,
+    see Graph.redundantSites.
+    """
+    cache_path = None
+    if cache_dir:
+        content = "\n".join(lines).encode()
+        digest = hashlib.sha256(f"{BUILD_CACHE_VERSION}:{minimize}:{elideDigest}:{name}:".encode() + content).hexdigest()
+        cache_path = os.path.join(cache_dir, digest + ".json")
+        try:
+            with open(cache_path, 'r') as fp:
+                entry = json.load(fp)
+            return name, entry, True
+        except (OSError, ValueError):
+            pass
+
+    graph = parseENFA(name, lines)
+    before = graph.stats()
+    sites, numSites = [], 0
+    if instrumented:
+        numSites = sum(1 for _, _, label in graph.edges() if label in instrumented)
+        sites = graph.redundantSites(instrumented)
+    graph.removeLoop()
+    reduced = graph.stats()
+    minimized = reduced
+    if minimize:
+        graph.minimize()
+        minimized = graph.stats()
+    entry = {
+        "start": graph.getStart(),
+        "end": graph.getEnd(),
+        "nodes": sorted(graph._nodes),
+        "edges": [list(e) for e in graph.edges()],
+        "stats": [before, reduced, minimized],
+        # call site number (the ENFA node the call edge enters), label, kind
+        "elided": [[dst[len(name) + 1:], label, kind] for (_, dst, label), kind in sites],
+        "sites": numSites,
+    }
+    if cache_path:
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as fp:
+            json.dump(entry, fp)
+        os.replace(tmp_path, cache_path)
+    return name, entry, False
+
+
+def readENFAFile(file_name):
+    base_name = os.path.basename(file_name)
+    with open(file_name, 'r') as fp:
+        return base_name[len("ENFA_"):-len(".txt")], fp.read().splitlines()
+
+
+def readENFAInputs(files, streams):
+    """
+    Yield (name, lines) from every ENFA file and stream. Raises ValueError
+    when two inputs define the same function, e.g. static functions of one
+    name in two translation units, whose automata would overwrite each other.
+    """
+    origins = {}
+    inputs = [(file_name, [readENFAFile(file_name)]) for file_name in files]
+    inputs += [(file_name, readENFAStream(file_name)) for file_name in streams]
+    for file_name, functions in inputs:
+        for name, lines in functions:
+            if name in origins:
+                raise ValueError(f"function {name} is defined in both {origins[name]} and {file_name}")
+            origins[name] = file_name
+            yield name, lines
+
+
+def boundedMap(pool, fn, items, window, *args):
+    """pool.map that keeps at most window functions in flight instead of submitting everything up front."""
+    pending = deque()
+    for name, lines in items:
+        pending.append(pool.submit(fn, name, lines, *args))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def graphFromEntry(name, entry):
+    graph = Graph(name)
+    graph.setStart(entry["start"])
+    graph.setEnd(entry["end"])
+    for node in entry["nodes"]:
+        graph._nodes.add(node)
+        graph._graph.setdefault(node, set())
+    for src, dst, ename in entry["edges"]:
+        graph.addEdge(src, dst, ename)
+    return graph
 
 
 if __name__ == "__main__" :
     import glob
+    from concurrent.futures import ProcessPoolExecutor
+
+    parser = argparse.ArgumentParser(description="Link ENFA_*.txt files into the enforcer policy")
+    parser.add_argument("--policy", type=str, default="./graph.policy", help="Compiled policy output (default: ./graph.policy).")
+    parser.add_argument("--dot", type=str, default="./graph.dot", help="DOT visualization output (default: ./graph.dot).")
+    parser.add_argument("--no-dot", action="store_true", help="Skip the DOT visualization export.")
+    parser.add_argument("--minimize", action="store_true", help="Also remove epsilon edges and merge equivalent states per function.")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count(), help="Worker processes parsing and reducing ENFA files (default: CPU count).")
+    parser.add_argument("--cache-dir", type=str, default="./.enfa_cache", help="Per-function build cache (default: ./.enfa_cache).")
+    parser.add_argument("--no-cache", action="store_true", help="Rebuild every function.")
+    parser.add_argument("--elide-dummies", type=str, default=None, metavar="FUNCTION_MAP",
+                        help="Find call sites of the functions in this map (DummyCallAddPass's library_functions.txt) whose dummy() "
+                             "is redundant, drop them from the policy and list them for DummyCallAddPass -dummy-elide.")
+    parser.add_argument("--elide-output", type=str, default="./dummy_elide.txt",
+                        help="Elided call sites written with --elide-dummies (default: ./dummy_elide.txt).")
+    args = parser.parse_args()
 
-    # Use glob to find all files starting with "ENAF_" and ending with ".txt"
-    file_pattern = "ENFA_*.txt"
-    files = glob.glob(file_pattern)
+    instrumented = None
+    if args.elide_dummies:
+        with open(args.elide_dummies, 'r') as fp:
+            instrumented = frozenset(line.split()[0] for line in fp if line.strip())
+
+    cache_dir = None if args.no_cache else args.cache_dir
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+
+    # Use glob to find all files starting with "ENAF_" and ending with ".txt",
+    # plus the per translation unit streams written with -mllvm -enfa-stream
+    files = glob.glob("ENFA_*.txt")
+    streams = glob.glob("*.enfa")
     graph_list = dict()
-    for file_name in files:
-        base_name = os.path.basename(file_name)  # Get the file name without the path
-        extracted_part = base_name[len("ENAF_"):-len(".txt")]
-        graph = Graph(extracted_part)
-        with open(file_name, 'r') as fp:
-            # building graph for each ENFA file
-            lines = fp.readlines()
-            start_state = extracted_part + "_" + lines[0].split("\n")[0].strip()
-            final_states = extracted_part + "_" + lines[1].split("\n")[0].strip()
-            graph.setStart(start_state)
-            graph.setEnd(final_states)
-            for line in lines[2:]:
-                fname, src, dst, ename = line.split('\n')[0].split(',')
-                graph.addEdge(extracted_part + "_" + src, extracted_part + "_" + dst, ename)
-        graph_list[extracted_part] = graph
-        graph.removeLoop()
+    totals = [[0, 0], [0, 0], [0, 0]]
+    hits = 0
+    elided = []
+    numSites = 0
+    jobs = max(args.jobs or 1, 1)
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        inputs = readENFAInputs(files, streams)
+        try:
+            for name, entry, hit in boundedMap(pool, buildFunction, inputs, 8 * jobs, args.minimize, cache_dir,
+                                               instrumented, instrumentedDigest(instrumented)):
+                graph_list[name] = graphFromEntry(name, entry)
+                hits += hit
+                numSites += entry["sites"]
+                elided.extend((name, site, label, kind) for site, label, kind in entry["elided"])
+                for total, (states, edges) in zip(totals, entry["stats"]):
+                    total[0] += states
+                    total[1] += edges
+        except ValueError as e:
+            parser.error(str(e))
+
+    before, reduced, minimized = totals
+    print(f"functions         : {len(graph_list)} ({hits} cached, {len(graph_list) - hits} rebuilt)")
+    print(f"epsilon reduction : {before[0]} states {before[1]} edges -> {reduced[0]} states {reduced[1]} edges")
+    if args.minimize:
+        print(f"minimization      : {reduced[0]} states {reduced[1]} edges -> {minimized[0]} states {minimized[1]} edges")
+    if instrumented is not None:
+        with open(args.elide_output, 'w') as fp:
+            for name, site, label, _ in sorted(elided):
+                fp.write(f"{name} {site} {label}\n")
+        kinds = {kind: sum(1 for *_, k in elided if k == kind) for kind in ("forced", "loop")}
+        print(f"dummy elision     : {len(elided)} of {numSites} call sites need no dummy() "
+              f"({kinds['forced']} forced, {kinds['loop']} loop) -> {args.elide_output}")
     
     visited = set()
     queue = []
@@ -193,8 +647,9 @@ if __name__ == "__main__" :
         next_update = graph.update(graph_list)
         for item in next_update:
             queue.append(item)
-    file_path = "./graph.dot"
-    exportDOTFormat(graph_list, visited, file_path)
+    exportPolicy(graph_list, visited, args.policy, bool(elided))
+    if not args.no_dot:
+        exportDOTFormat(graph_list, visited, args.dot, bool(elided))
     # graph = Graph.construct_from_dot(file_path)
     # for u, v, e in graph.edges():
     #     print(f"{u} -> {v} [label={e}]")
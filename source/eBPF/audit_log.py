@@ -0,0 +1,115 @@
+import sys
+import json
+import time
+import queue
+import threading
+
+LOG_LEVELS = {"debug": 10, "info": 20, "warning": 30, "error": 40, "off": 100}
+
+
+class AsyncWriter:
+    """
+    Bounded queue in front of a file, drained by a background thread.
+
+    write() never blocks: when the queue is full the item is dropped and
+    counted. The writer thread takes everything queued at once, formats it
+    with format_item and issues a single write and flush per batch.
+    """
+    def __init__(self, fp, format_item=None, max_queue=65536, batch_size=4096):
+        self.fp = fp
+        self.format_item = format_item
+        self.batch_size = batch_size
+        self.dropped = 0
+        self.written = 0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def write(self, item):
+        try:
+            self._queue.put_nowait(item)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            batch = [item]
+            while item is not None and len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                batch.append(item)
+            closing = batch[-1] is None
+            if closing:
+                batch.pop()
+            if batch:
+                if self.format_item:
+                    batch = [self.format_item(item) for item in batch]
+                self.fp.write(batch[0][:0].join(batch))
+                self.fp.flush()
+                self.written += len(batch)
+            if closing:
+                return
+
+    def close(self):
+        """Write out everything queued so far and stop the writer thread."""
+        self._queue.put(None)
+        self._thread.join()
+
+
+class AuditLog:
+    """
+    Leveled audit records of the tracer, written as text or JSON lines by an
+    AsyncWriter. Records below the configured level are discarded before
+    anything is queued, drops are counted per level.
+    """
+    def __init__(self, fp=sys.stdout, level="info", fmt="text", max_queue=65536):
+        self.level = LOG_LEVELS[level]
+        self.dropped = {name: 0 for name in LOG_LEVELS if name != "off"}
+        self._format = self.format_json if fmt == "json" else self.format_text
+        self.writer = None
+        if fp is not None and self.level < LOG_LEVELS["off"]:
+            self.writer = AsyncWriter(fp, self._format, max_queue)
+
+    def enabled(self, level):
+        return self.writer is not None and LOG_LEVELS[level] >= self.level
+
+    def log(self, level, event, **fields):
+        if not self.enabled(level):
+            return
+        if not self.writer.write((time.time(), level, event, fields)):
+            self.dropped[level] += 1
+
+    def debug(self, event, **fields):
+        self.log("debug", event, **fields)
+
+    def info(self, event, **fields):
+        self.log("info", event, **fields)
+
+    def warning(self, event, **fields):
+        self.log("warning", event, **fields)
+
+    def error(self, event, **fields):
+        self.log("error", event, **fields)
+
+    @staticmethod
+    def format_json(record):
+        ts, level, event, fields = record
+        return json.dumps({"time": ts, "level": level, "event": event, **fields}) + "\n"
+
+    @staticmethod
+    def format_text(record):
+        ts, level, event, fields = record
+        details = " ".join(f"{key}={value}" for key, value in fields.items())
+        return f"{time.strftime('%H:%M:%S', time.localtime(ts))} {level.upper():<7} {event} {details}\n"
+
+    def close(self):
+        if self.writer is None:
+            return
+        self.writer.close()
+        if any(self.dropped.values()):
+            print(f"Audit log dropped {sum(self.dropped.values())} records: {self.dropped}", file=sys.stderr)
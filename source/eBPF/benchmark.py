@@ -0,0 +1,179 @@
+import os
+import json
+import time
+import random
+import argparse
+import tempfile
+import tracemalloc
+
+from enforce_NFA_ebpf import DataLoader, Graph, PolicyGraph, DFA, EVENT_LIBC
+from replay import ReplayTracer, synthetic_trace, read_trace
+from bitset_nfa import BitsetNFA, np
+from pushdown_nfa import PushdownNFA
+
+
+def synthetic_policy(num_nodes, alphabet=64, nodes_per_function=50, seed=0):
+    """
+    Write a random policy shaped like txtToDotConvert.py output (per-function
+    chains with epsilon branches and loops, linked by call_/ret_ edges) and
+    return (dot_path, function_map).
+    """
+    rng = random.Random(seed)
+    labels = [f"lib{i}" for i in range(alphabet)]
+    num_functions = max(1, num_nodes // nodes_per_function)
+    names = ["main"] + [f"fn{i}" for i in range(1, num_functions)]
+    size = max(2, num_nodes // num_functions)
+    lines = []
+    for k, name in enumerate(names):
+        for i in range(size - 1):
+            src, dst = f"{name}_{i}", f"{name}_{i + 1}"
+            if k + 1 < num_functions and rng.random() < 0.05:
+                callee = names[rng.randrange(k + 1, num_functions)]
+                lines.append(f'\t{src} -> {callee}_0[label="call_{callee}@{dst}"]')
+                lines.append(f'\t{callee}_{size - 1} -> {dst}[label="ret_{callee}"]')
+            else:
+                lines.append(f'\t{src} -> {dst}[label="{rng.choice(labels + ["e"])}"]')
+            if rng.random() < 0.1:
+                lines.append(f'\t{src} -> {name}_{rng.randrange(0, size - 1)}[label="e"]')
+            if rng.random() < 0.1:
+                lines.append(f'\t{src} -> {name}_{rng.randrange(i + 1, size)}[label="{rng.choice(labels)}"]')
+
+    fd, dot_path = tempfile.mkstemp(suffix=".dot")
+    with os.fdopen(fd, "w") as fp:
+        fp.write("digraph main {\n" + "\n".join(lines) + "\n}")
+    return dot_path, {label: i + 1 for i, label in enumerate(labels)}
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+def time_steps(step, initial, events):
+    """Feed the libc events of a trace to step(state, func_id) with per-pid state; return events/sec and latencies."""
+    states = {}
+    latencies = []
+    start = time.perf_counter()
+    for _, pid, _, kind, func_id, _, _ in events:
+        if kind != EVENT_LIBC:
+            continue
+        t0 = time.perf_counter_ns()
+        state = step(states.get(pid, initial), func_id)
+        latencies.append(time.perf_counter_ns() - t0)
+        states[pid] = state if state is not None else initial
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "events_per_sec": len(latencies) / max(elapsed, 1e-9),
+        "p50_ns": percentile(latencies, 0.50),
+        "p99_ns": percentile(latencies, 0.99),
+    }
+
+
+def benchmark_policy(name, dot_path, function_map, num_events, num_pids, max_dfa_states, trace=None):
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    if dot_path.endswith(".policy"):
+        graph = PolicyGraph(dot_path)
+    else:
+        graph = Graph(dot_file=dot_path)
+    dfa = DFA(graph, function_map, max_states=max_dfa_states)
+    compile_time = time.perf_counter() - t0
+    _, compile_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    events = trace if trace is not None else synthetic_trace(graph, function_map, num_events, num_pids, violation_rate=0.01)
+    rev_function_map = {func_id: label for label, func_id in function_map.items()}
+
+    def nfa_step(heads, func_id):
+        new_heads = graph.move(heads, rev_function_map.get(func_id))
+        return graph.closure_of(new_heads) if new_heads else None
+
+    result = {
+        "policy": name,
+        "nodes": graph.num_nodes(),
+        "edges": graph.num_edges(),
+        "dfa_complete": dfa.complete,
+        "dfa_states": dfa.num_states(),
+        "compile_sec": compile_time,
+        "compile_peak_bytes": compile_peak,
+        "events": len(events),
+        "nfa": time_steps(nfa_step, graph.start_heads(), events),
+        "dfa": time_steps(dfa.step, dfa.initial_state(), events),
+    }
+    pushdown = PushdownNFA(graph, function_map, max_states=max_dfa_states)
+    result["pushdown"] = time_steps(pushdown.step, pushdown.initial_state(), events)
+
+    tracer = ReplayTracer(graph, function_map, dfa)
+    start = time.perf_counter()
+    tracer.replay(events)
+    elapsed = time.perf_counter() - start
+
+    # separate run for memory, tracemalloc would skew the timing above
+    tracemalloc.start()
+    ReplayTracer(graph, function_map, dfa).replay(events)
+    _, replay_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    result["tracer"] = {"events_per_sec": len(events) / max(elapsed, 1e-9), "kills": tracer.kills, "peak_bytes": replay_peak}
+
+    if np is not None:
+        bitset = BitsetNFA(graph, function_map)
+        result["bitset"] = time_steps(bitset.step, bitset.initial_state(), events)
+        tracer = ReplayTracer(graph, function_map, bitset, batch_verify=True)
+        start = time.perf_counter()
+        tracer.replay(events)
+        result["bitset"]["batch_events_per_sec"] = len(events) / max(time.perf_counter() - start, 1e-9)
+    return result
+
+
+def print_results(results):
+    print(f"{'policy':<24}{'nodes':>8}{'edges':>8}{'dfa':>8}{'compile':>10}"
+          f"{'nfa ev/s':>12}{'nfa p50/p99 ns':>18}{'dfa ev/s':>12}{'dfa p50/p99 ns':>18}{'pda ev/s':>12}{'tracer ev/s':>13}{'bitset ev/s':>13}{'batch ev/s':>12}{'peak MiB':>10}")
+    for r in results:
+        peak = max(r["compile_peak_bytes"], r["tracer"]["peak_bytes"]) / (1 << 20)
+        bitset = r.get("bitset")
+        bitset_rates = f"{bitset['events_per_sec']:>13.0f}{bitset['batch_events_per_sec']:>12.0f}" if bitset else f"{'n/a':>13}{'n/a':>12}"
+        print(f"{r['policy']:<24}{r['nodes']:>8}{r['edges']:>8}{r['dfa_states'] if r['dfa_complete'] else 'n/a':>8}"
+              f"{r['compile_sec']:>9.3f}s"
+              f"{r['nfa']['events_per_sec']:>12.0f}{str(r['nfa']['p50_ns']) + '/' + str(r['nfa']['p99_ns']):>18}"
+              f"{r['dfa']['events_per_sec']:>12.0f}{str(r['dfa']['p50_ns']) + '/' + str(r['dfa']['p99_ns']):>18}"
+              f"{r['pushdown']['events_per_sec']:>12.0f}{r['tracer']['events_per_sec']:>13.0f}{bitset_rates}{peak:>10.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline throughput benchmark for the policy matcher")
+    parser.add_argument("--dot-file", type=str, action="append", default=[],
+                        help="graph.dot or graph.policy produced by txtToDotConvert.py (e.g. from test/*.c), may be repeated.")
+    parser.add_argument("--function-map", type=str, default=None, help="Function map for --dot-file policies.")
+    parser.add_argument("--trace", type=str, default=None, help="Replay this recorded trace against --dot-file policies instead of a synthetic one.")
+    parser.add_argument("--synthetic-sizes", type=str, default="100,1000,10000",
+                        help="Comma separated node counts of generated policies (default: 100,1000,10000).")
+    parser.add_argument("--events", type=int, default=100000, help="Events per synthetic trace (default: 100000).")
+    parser.add_argument("--pids", type=int, default=8, help="Concurrent processes in synthetic traces (default: 8).")
+    parser.add_argument("--max-dfa-states", type=int, default=65536, help="Upper bound on determinized states.")
+    parser.add_argument("--json", type=str, default=None, help="Also write the results to this JSON file.")
+    args = parser.parse_args()
+
+    results = []
+    if args.dot_file:
+        if not args.function_map:
+            parser.error("--function-map is required with --dot-file")
+        function_map, _ = DataLoader(args.function_map, None).get_lib_function_map()
+        trace = list(read_trace(args.trace)) if args.trace else None
+        for dot_path in args.dot_file:
+            results.append(benchmark_policy(os.path.basename(dot_path), dot_path, function_map,
+                                            args.events, args.pids, args.max_dfa_states, trace))
+
+    for size in filter(None, args.synthetic_sizes.split(",")):
+        dot_path, function_map = synthetic_policy(int(size))
+        try:
+            results.append(benchmark_policy(f"synthetic-{size}", dot_path, function_map,
+                                            args.events, args.pids, args.max_dfa_states))
+        finally:
+            os.remove(dot_path)
+
+    print_results(results)
+    if args.json:
+        with open(args.json, "w") as fp:
+            json.dump(results, fp, indent=2)
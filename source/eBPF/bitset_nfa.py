@@ -0,0 +1,115 @@
+try:
+    import numpy as np
+except ImportError:
+    # only --engine bitset needs numpy
+    np = None
+
+
+class LabelMatrix:
+    """
+    Sparse (CSR) transition matrix of one function label with the epsilon
+    closure folded in: source node srcs[i] reaches indices[indptr[i]:indptr[i + 1]].
+    """
+    def __init__(self, srcs, indptr, indices):
+        self.srcs = srcs
+        self.indptr = indptr
+        self.indices = indices
+
+
+class BitsetNFA:
+    """
+    Integer-indexed form of a Graph stepped with NumPy.
+
+    A state is a boolean vector over the graph nodes (the current head set).
+    Each function ID has a LabelMatrix, so a step is a handful of array
+    operations over the active heads instead of walking edges and closures
+    per head, and step_many advances the states of many processes that call
+    the same function at once. Exposes the same stepping interface as DFA.
+    """
+    complete = False
+
+    def __init__(self, graph, function_map):
+        if np is None:
+            raise RuntimeError("The bitset engine needs numpy (pip install numpy)")
+        self.graph = graph
+        self.function_map = function_map
+        self.nodes = sorted(graph.nodes())
+        self.index = {node: i for i, node in enumerate(self.nodes)}
+        self.table = {}
+        self.matrices = {}
+
+        # aliases sharing a function ID share its matrix
+        edges_by_id = {}
+        for src in self.nodes:
+            for label, dsts in graph.label_edges(src).items():
+                if label in function_map:
+                    edges_by_id.setdefault(function_map[label], []).extend((self.index[src], dst) for dst in dsts)
+
+        closure_index = {}
+        for func_id, edges in edges_by_id.items():
+            closures = {}
+            for src, dst in edges:
+                if dst not in closure_index:
+                    closure_index[dst] = [self.index[node] for node in graph.closure(dst)]
+                closures.setdefault(src, set()).update(closure_index[dst])
+            srcs = sorted(closures)
+            targets = [sorted(closures[src]) for src in srcs]
+            indptr = np.zeros(len(srcs) + 1, dtype=np.intp)
+            np.cumsum([len(t) for t in targets], out=indptr[1:])
+            indices = np.fromiter((dst for t in targets for dst in t), dtype=np.intp, count=indptr[-1])
+            self.matrices[func_id] = LabelMatrix(np.array(srcs, dtype=np.intp), indptr, indices)
+
+        self.start = self.vector(graph.start_heads())
+        end = graph._end[0] if graph._end else None
+        self.end = self.index.get(end)
+
+    def vector(self, heads):
+        state = np.zeros(len(self.nodes), dtype=bool)
+        state[[self.index[node] for node in heads]] = True
+        return state
+
+    def heads(self, state):
+        return {self.nodes[i] for i in np.flatnonzero(state)}
+
+    def state_of(self, heads):
+        return self.vector(self.graph.closure_of(heads))
+
+    def initial_state(self):
+        return self.start
+
+    def step(self, state, func_id):
+        """Return the head vector reached on func_id, or None if the call is not allowed."""
+        return self.step_many([state], func_id)[0]
+
+    def step_many(self, states, func_id):
+        """
+        Advance a list of head vectors (one per process) on func_id together;
+        rejected calls come back as None.
+        """
+        matrix = self.matrices.get(func_id)
+        if matrix is None:
+            return [None] * len(states)
+        heads = np.stack(states)
+        procs, nodes = np.nonzero(heads)
+        # rows of the active heads that have an edge on func_id
+        pos = np.searchsorted(matrix.srcs, nodes)
+        pos[pos == len(matrix.srcs)] = 0
+        hit = matrix.srcs[pos] == nodes
+        procs, pos = procs[hit], pos[hit]
+        starts = matrix.indptr[pos]
+        counts = matrix.indptr[pos + 1] - starts
+        # gather every row's index range in one go
+        offsets = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+        result = np.zeros(heads.shape, dtype=bool)
+        result[np.repeat(procs, counts), matrix.indices[offsets]] = True
+        alive = result.any(axis=1)
+        return [row if ok else None for row, ok in zip(result, alive)]
+
+    def is_accepting(self, state):
+        return self.end is not None and bool(state[self.end])
+
+    def head_count(self, state):
+        return int(np.count_nonzero(state))
+
+    def num_states(self):
+        return len(self.nodes)
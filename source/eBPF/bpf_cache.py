@@ -0,0 +1,262 @@
+import os
+import json
+import struct
+import ctypes
+import hashlib
+
+from bcc import BPF, lib
+from bcc import table as bcc_table
+
+CACHE_VERSION = 1
+
+# ld_imm64 whose src register is BPF_PSEUDO_MAP_FD carries a map fd in its immediate
+BPF_LD_IMM64 = 0x18
+BPF_PSEUDO_MAP_FD = 1
+BPF_INSN_SIZE = 8
+
+BPF_MAP_TYPE_HASH = 1
+BPF_MAP_TYPE_ARRAY = 2
+BPF_MAP_TYPE_PERCPU_ARRAY = 6
+BPF_MAP_TYPE_LRU_HASH = 9
+BPF_MAP_TYPE_RINGBUF = 27
+
+TABLE_CLASSES = {
+    BPF_MAP_TYPE_HASH: bcc_table.HashTable,
+    BPF_MAP_TYPE_ARRAY: bcc_table.Array,
+    BPF_MAP_TYPE_PERCPU_ARRAY: bcc_table.PerCpuArray,
+    BPF_MAP_TYPE_LRU_HASH: bcc_table.LruHash,
+    BPF_MAP_TYPE_RINGBUF: bcc_table.RingBuf,
+}
+
+# Smallest program BCC will accept, only used to get a BPF object on a warm start
+STUB_PROGRAM = "int bpf_cache_stub(void *ctx) { return 0; }"
+
+
+def elf_build_id(path):
+    """Return the NT_GNU_BUILD_ID of an ELF64 file as hex, or None."""
+    with open(path, "rb") as fp:
+        header = fp.read(64)
+        if header[:4] != b"\x7fELF" or header[4] != 2:
+            return None
+        endian = "<" if header[5] == 1 else ">"
+        phoff, = struct.unpack_from(endian + "Q", header, 32)
+        phentsize, phnum = struct.unpack_from(endian + "HH", header, 54)
+        for i in range(phnum):
+            fp.seek(phoff + i * phentsize)
+            p_type, _, p_offset, _, _, p_filesz = struct.unpack(endian + "IIQQQQ", fp.read(40))
+            if p_type != 4:  # PT_NOTE
+                continue
+            fp.seek(p_offset)
+            notes = fp.read(p_filesz)
+            pos = 0
+            while pos + 12 <= len(notes):
+                namesz, descsz, n_type = struct.unpack_from(endian + "III", notes, pos)
+                name_end = pos + 12 + ((namesz + 3) & ~3)
+                desc_end = name_end + ((descsz + 3) & ~3)
+                if n_type == 3 and notes[pos + 12:pos + 12 + namesz].rstrip(b"\0") == b"GNU":
+                    return notes[name_end:name_end + descsz].hex()
+                pos = desc_end
+    return None
+
+
+class BPFProgramCache:
+    """
+    On-disk cache of BCC compiled programs.
+
+    Entries are keyed by the program text, its cflags, the running kernel and
+    the libc build ID. An entry stores the bytecode of each function with its
+    map fd relocations and the definition of each map. A warm start recreates
+    the maps, patches the fds in and loads the bytecode, so only a trivial
+    stub program goes through clang.
+
+    Only the max_entries most recently used entries are kept: a hit touches
+    its entry and a store prunes the least recently used ones.
+    """
+    def __init__(self, cache_dir, max_entries=16):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def key(self, text, cflags, libc_path):
+        libc_id = elf_build_id(libc_path)
+        if libc_id is None:
+            st = os.stat(libc_path)
+            libc_id = f"{st.st_size}-{st.st_mtime_ns}"
+        digest = hashlib.sha256()
+        for part in [str(CACHE_VERSION), text, " ".join(cflags), os.uname().release, libc_id]:
+            digest.update(part.encode())
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def load(self, key):
+        """Rebuild a BPF object from the cache entry for key, or return None on a miss."""
+        try:
+            with open(self._path(key), "r") as fp:
+                entry = json.load(fp)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        os.utime(self._path(key))
+
+        bpf = BPF(text=STUB_PROGRAM)
+        map_fds = {}
+        for name, desc in entry["maps"].items():
+            max_entries = desc["max_entries"]
+            fd = lib.bcc_create_map(desc["type"], name.encode(), desc["key_size"], desc["leaf_size"], max_entries, desc["flags"])
+            if fd < 0:
+                raise RuntimeError(f"Unable to recreate cached map {name}")
+            map_fds[name] = fd
+            keytype = BPF._decode_table_type(json.loads(desc["key_desc"])) if desc["key_desc"] else ctypes.c_int
+            leaftype = BPF._decode_table_type(json.loads(desc["leaf_desc"])) if desc["leaf_desc"] else ctypes.c_int
+            table = TABLE_CLASSES[desc["type"]](bpf, -1, fd, keytype, leaftype, name=name)
+            # TableBase reads these from bpf.module by map id, which the stub does not have
+            table.ttype = desc["type"]
+            table.flags = desc["flags"]
+            table.max_entries = max_entries
+            bpf.tables[name] = table
+
+        for name, func in entry["functions"].items():
+            insns = bytearray.fromhex(func["insns"])
+            for index, map_name in func["relocs"]:
+                struct.pack_into("<i", insns, index * BPF_INSN_SIZE + 4, map_fds[map_name])
+            buf = ctypes.create_string_buffer(bytes(insns), len(insns))
+            fd = lib.bcc_prog_load(func["prog_type"], name.encode(), buf, len(insns), b"GPL",
+                                   entry["kern_version"], 0, None, 0)
+            if fd < 0:
+                raise RuntimeError(f"Unable to load cached program {name}")
+            bpf.funcs[name] = BPF.Function(bpf, name, fd)
+
+        for name in entry["functions"]:
+            if name.startswith("tracepoint__"):
+                category, event = name[len("tracepoint__"):].split("__", 1)
+                bpf.attach_tracepoint(tp=f"{category}:{event}", fn_name=name)
+            elif name.startswith("raw_tracepoint__"):
+                bpf.attach_raw_tracepoint(tp=name[len("raw_tracepoint__"):], fn_name=name)
+        self.hits += 1
+        return bpf
+
+    def store(self, key, bpf, functions):
+        """Save the bytecode of the named functions of a freshly compiled BPF object."""
+        module = bpf.module
+        maps = {}
+        fd_to_map = {}
+        for map_id in range(lib.bpf_num_tables(module)):
+            name = lib.bpf_table_name(module, map_id).decode()
+            fd_to_map[lib.bpf_table_fd_id(module, map_id)] = name
+            key_desc = lib.bpf_table_key_desc_id(module, map_id)
+            leaf_desc = lib.bpf_table_leaf_desc_id(module, map_id)
+            maps[name] = {
+                "type": lib.bpf_table_type_id(module, map_id),
+                "key_size": lib.bpf_table_key_size_id(module, map_id),
+                "leaf_size": lib.bpf_table_leaf_size_id(module, map_id),
+                "max_entries": lib.bpf_table_max_entries_id(module, map_id),
+                "flags": lib.bpf_table_flags_id(module, map_id),
+                "key_desc": key_desc.decode() if key_desc else "",
+                "leaf_desc": leaf_desc.decode() if leaf_desc else "",
+            }
+
+        entry_functions = {}
+        for name, prog_type in functions.items():
+            insns = bytes(bpf.dump_func(name))
+            relocs = []
+            for index in range(len(insns) // BPF_INSN_SIZE):
+                code, regs, _, imm = struct.unpack_from("<BBhi", insns, index * BPF_INSN_SIZE)
+                if code == BPF_LD_IMM64 and regs >> 4 == BPF_PSEUDO_MAP_FD and imm in fd_to_map:
+                    relocs.append((index, fd_to_map[imm]))
+            entry_functions[name] = {"prog_type": prog_type, "insns": insns.hex(), "relocs": relocs}
+
+        entry = {
+            "version": CACHE_VERSION,
+            "kern_version": lib.bpf_module_kern_version(module),
+            "maps": maps,
+            "functions": entry_functions,
+        }
+        tmp_path = self._path(key) + ".tmp"
+        with open(tmp_path, "w") as fp:
+            json.dump(entry, fp)
+        os.replace(tmp_path, self._path(key))
+        self.prune()
+
+    def prune(self):
+        """Remove all but the max_entries most recently used entries."""
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                entries.append((os.stat(path).st_mtime_ns, path))
+            except OSError:
+                continue
+        entries.sort(reverse=True)
+        for _, path in entries[self.max_entries:]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def report(self):
+        return f"BPF cache hits : {self.hits} misses : {self.misses}"
+
+
+# Arrays written through BCC's bounds-checked keys, like enabled and dropped in the tracer
+CHECK_PROGRAM = """
+BPF_ARRAY(words, u64, 4);
+BPF_PERCPU_ARRAY(counts, u64, 1);
+int bpf_cache_check(void *ctx) { return 0; }
+"""
+
+
+def check_warm_start(cache_dir):
+    """
+    Compile CHECK_PROGRAM cold, store it, rebuild it from the cache and write
+    the last slot of both arrays in each. Returns a list of problems, empty if
+    the warm tables behave like the cold ones.
+    """
+    cache = BPFProgramCache(cache_dir)
+    key = cache.key(CHECK_PROGRAM, [], "/proc/self/exe")
+    cold = BPF(text=CHECK_PROGRAM)
+    cache.store(key, cold, {"bpf_cache_check": BPF.KPROBE})
+    warm = cache.load(key)
+    if warm is None:
+        return ["cache entry was not read back"]
+
+    problems = []
+    for name in ("words", "counts"):
+        for label, bpf in (("cold", cold), ("warm", warm)):
+            table = bpf[name]
+            if (table.ttype, table.flags, table.max_entries) != (cold[name].ttype, cold[name].flags, cold[name].max_entries):
+                problems.append(f"{label} {name}: type/flags/max_entries differ from the compiled map")
+            last = table.max_entries - 1
+            try:
+                if name == "counts":
+                    table[table.Key(last)] = table.Leaf(*[7] * len(table.Leaf()))
+                    value = sum(table[table.Key(last)])
+                    expected = 7 * len(table.Leaf())
+                else:
+                    table[table.Key(last)] = table.Leaf(7)
+                    value, expected = table[table.Key(last)].value, 7
+            except (IndexError, KeyError) as e:
+                problems.append(f"{label} {name}: write to slot {last} failed: {e!r}")
+                continue
+            if value != expected:
+                problems.append(f"{label} {name}: read back {value}, expected {expected}")
+    os.remove(cache._path(key))
+    return problems
+
+
+if __name__ == "__main__":
+    import sys
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        problems = check_warm_start(cache_dir)
+    for problem in problems:
+        print(problem)
+    print("warm start check: " + ("FAILED" if problems else "ok"))
+    sys.exit(1 if problems else 0)
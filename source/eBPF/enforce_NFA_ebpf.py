@@ -1,15 +1,56 @@
-from bcc import BPF
 import os
+import sys
+import time
+import ctypes
+import random
 import signal
+import struct
 import argparse
 import resource
+import threading
+from collections import deque
 
-from tqdm import tqdm
+from policy_format import PolicyArtifact
+from audit_log import AuditLog, AsyncWriter, LOG_LEVELS
+from metrics import TracerMetrics, MetricsExporter
+from bitset_nfa import BitsetNFA
+from pushdown_nfa import PushdownNFA, StateOverflow
+
+try:
+    from bcc import BPF
+    from bpf_cache import BPFProgramCache
+    from probe_attach import bulk_attach, bulk_detach, load_segments, resolve_symbol_addresses, load_symbol_index
+except ImportError:
+    # replay.py and benchmark.py drive the matcher offline without BCC
+    BPF = None
 
 os.environ['BCC_PROBE_LIMIT'] = '8192'
 soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
 resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
 
+# Fixed-size ring buffer record, keep in sync with struct event in the BPF program
+EVENT_DUMMY = 1
+EVENT_LIBC = 2
+EVENT_VIOLATION = 3
+EVENT_EXIT = 4  # func_id is 1 if this was the last thread of the process
+EVENT_FORK = 5  # pid, tid of the child, func_id is the parent pid
+EVENT_EXEC = 6  # func_id is 1 if the new image is policy-bound and the state was reset
+EVENT_UNANNOUNCED = 7  # cross-check hit without a matching dummy(), next_lib_call is the pending ID
+EVENT_NO_BASE = 8  # probe hit in a registered process whose libc base is unknown, the tracer reads it from /proc
+# graph attribute txtToDotConvert.py writes into a DOT policy whose redundant dummy() sites were elided
+DOT_ELIDED = 'comment="elided-dummies"'
+
+EVENT_NAMES = {EVENT_DUMMY: "dummy", EVENT_LIBC: "libc", EVENT_VIOLATION: "violation", EVENT_EXIT: "exit",
+               EVENT_FORK: "fork", EVENT_EXEC: "exec", EVENT_UNANNOUNCED: "unannounced",
+               EVENT_NO_BASE: "no_base"}
+EVENT_FORMAT = struct.Struct("=QIIIIiI")  # ts, pid, tid, kind, func_id, next_lib_call, state
+
+# Recorded traces are this magic followed by raw EVENT_FORMAT records
+TRACE_MAGIC = b"NFATRC01"
+
+# Called once by every dynamically linked process, used to learn where libc is mapped
+LIBC_ANCHOR = "__libc_start_main"
+
 class DataLoader:
     def __init__(self, function_map_path="library_functions.txt", function_list_path="library_function_list.txt"):
         self._path_lib_func = function_map_path
@@ -17,7 +58,8 @@ class DataLoader:
         self.function_map = {}
         self.rev_function_map = {}
         self.library_function_called = []
-        self.read_function_list()
+        if self._lib_called_func_path:
+            self.read_function_list()
         self.read_function_map()
 
     def read_function_list(self):
@@ -46,13 +88,24 @@ class DataLoader:
         return self.library_function_called
 
 class Graph:
-    def __init__(self, dot_file):
+    """
+    Policy graph parsed from DOT text. Nodes are named <function>_<number>.
+
+    Library call edges are indexed by label per node on first use, epsilon
+    closures are computed once per node and memoized. PolicyGraph exposes the
+    same interface over a compiled policy.
+    """
+    def __init__(self, dot_file=None):
         self._graph = {}
         self._start = None
         self._end = None
         self._heads = []
+        self.start_node = "main_0"
+        # redundant dummy() sites were elided, only --syscall-only enforces it soundly
+        self.elided = False
 
-        self.build_from_dotfile(dot_file)
+        if dot_file:
+            self.build_from_dotfile(dot_file)
         self._initialize()
 
     def build_from_dotfile(self, dot_file):
@@ -62,6 +115,8 @@ class Graph:
         with open(dot_file, "r") as file:
             for line in file:
                 line = line.strip()
+                if line == DOT_ELIDED:
+                    self.elided = True
                 if "->" not in line or '[label="' not in line:
                     continue
                 parts = line.split("->")
@@ -95,41 +150,111 @@ class Graph:
         self._end = end_nodes
 
     def _initialize(self):
-        self._heads = ["main_0"]
+        self._heads = [self.start_node]
         self.next_func_call = None
         self.function_call_list = []
+        self._closures = {}
+        self._label_edges = {}
         self.update_epsillon_heads()
         
     def reset(self):
-        self._initialize()
+        self._heads = [self.start_node]
+        self.next_func_call = None
+        self.function_call_list = []
+        self.update_epsillon_heads()
 
     def get_heads(self):
         return self._heads
 
-    def update_epsillon_heads(self):
-        new_heads = []
-        stack = list(self._heads)
-        visited = set()
+    @staticmethod
+    def is_epsilon(src, label):
+        return label == "e" or label.startswith("call_") or label.startswith("ret_") or src.split("_")[0] == label
+
+    def nodes(self):
+        return self._graph.keys()
+
+    def num_nodes(self):
+        return len(self._graph)
+
+    def num_edges(self):
+        return sum(len(edges) for edges in self._graph.values())
+
+    def edges(self, node):
+        """Every (dst, label) edge leaving node."""
+        return self._graph.get(node, [])
+
+    def epsilon_edges(self, node):
+        return [(dst, label) for dst, label in self._graph.get(node, []) if self.is_epsilon(node, label)]
+
+    def library_edges(self, node):
+        return [(dst, label) for dst, label in self._graph.get(node, []) if not self.is_epsilon(node, label)]
+
+    def node_name(self, node):
+        return node
+
+    def node_key(self, name):
+        """Node of the given name, None if the policy has none."""
+        return name if name in self._graph else None
+
+    def closure(self, node):
+        """Return the epsilon closure of node, computed once and memoized."""
+        if node in self._closures:
+            return self._closures[node]
+        reached = {node}
+        stack = [node]
         while stack:
             curr = stack.pop()
-            if curr not in visited:
-                visited.add(curr)
-            new_heads.append(curr)
-            for node, label in self._graph.get(curr, []):
-                if label == "e" or label.startswith("call_") or label.startswith("ret_") or curr.split("_")[0] == label:
-                    stack.append(node)
-        self._heads = new_heads
+            for dst, label in self._graph.get(curr, []):
+                if dst not in reached and self.is_epsilon(curr, label):
+                    reached.add(dst)
+                    stack.append(dst)
+        self._closures[node] = frozenset(reached)
+        return self._closures[node]
+
+    def closure_of(self, nodes):
+        heads = set()
+        for node in nodes:
+            heads |= self.closure(node)
+        return frozenset(heads)
+
+    def start_heads(self):
+        return self.closure(self.start_node)
+
+    def label_edges(self, node):
+        """{label: [dst]} of the library call edges leaving node, built on first use."""
+        by_label = self._label_edges.get(node)
+        if by_label is None:
+            by_label = {}
+            for dst, label in self.library_edges(node):
+                by_label.setdefault(label, []).append(dst)
+            self._label_edges[node] = by_label
+        return by_label
+
+    def move(self, heads, label):
+        """Non-epsilon successors of heads over label (no closure applied)."""
+        new_heads = set()
+        for head in heads:
+            new_heads.update(self.label_edges(head).get(label, ()))
+        return new_heads
+
+    def alphabet(self):
+        """Labels of non-epsilon edges, i.e. every library call the policy can accept."""
+        return {label for node in self.nodes() for _, label in self.library_edges(node)}
+
+    def labels_from(self, heads):
+        labels = set()
+        for head in heads:
+            labels.update(self.label_edges(head))
+        return labels
+
+    def update_epsillon_heads(self):
+        self._heads = list(self.closure_of(self._heads))
 
     def check_func_call(self, next_func_call):
         if not next_func_call:
             return False
         
-        new_heads = set()
-        for head in self._heads:
-            edges = self._graph[head]
-            for e in edges:
-                if e[1] == next_func_call:
-                    new_heads.add(e[0])
+        new_heads = self.move(self._heads, next_func_call)
 
         self._heads = list(new_heads)
         self.update_epsillon_heads()
@@ -137,164 +262,1339 @@ class Graph:
         return False
 
 
+class PolicyGraph(Graph):
+    """
+    Graph over the memory-mapped arrays of a compiled policy (--policy).
+
+    Nodes are the artifact's integer IDs and epsilon closures are read from
+    its closure table, so loading only decodes the label names. Node names
+    are decoded on request, for diagnostics.
+    """
+    def __init__(self, policy_file):
+        self.artifact = PolicyArtifact(policy_file)
+        self._labels = self.artifact.label_names()
+        self._names = None
+        self._graph = None
+        self._start = [self.artifact.start]
+        self._end = list(self.artifact.ends)
+        self.start_node = self.artifact.start
+        self.elided = self.artifact.elided
+        self._initialize()
+
+    def nodes(self):
+        return range(self.artifact.num_nodes)
+
+    def num_nodes(self):
+        return self.artifact.num_nodes
+
+    def num_edges(self):
+        return self.artifact.num_edges
+
+    def edges(self, node):
+        return self.epsilon_edges(node) + self.library_edges(node)
+
+    def epsilon_edges(self, node):
+        return [(dst, self._labels[label]) for dst, label in self.artifact.epsilon_edges(node)]
+
+    def library_edges(self, node):
+        return [(dst, self._labels[label]) for dst, label in self.artifact.library_edges(node)]
+
+    def node_name(self, node):
+        return self.artifact.node_name(node)
+
+    def node_key(self, name):
+        if self._names is None:
+            self._names = {name: node for node, name in enumerate(self.artifact.node_names())}
+        return self._names.get(name)
+
+    def closure(self, node):
+        """Closures are shared by the nodes of an epsilon cycle, memoized per closure ID."""
+        closure_id = self.artifact.closure_id[node]
+        closure = self._closures.get(closure_id)
+        if closure is None:
+            closure = self._closures[closure_id] = frozenset(self.artifact.closure(node))
+        return closure
+
+    def alphabet(self):
+        return {self._labels[label] for label in set(self.artifact.lib_label)}
+
+
+def labels_by_id(function_map):
+    """Function ID -> the labels carrying it; aliases of one libc address can share an ID."""
+    labels = {}
+    for label, func_id in function_map.items():
+        labels.setdefault(func_id, []).append(label)
+    return labels
+
+
+class DFA:
+    """
+    Determinized (and minimized) form of a Graph.
+
+    Transitions live in a flat table keyed by (state, function ID) so a libc
+    event costs one dict lookup. When subset construction goes past
+    max_states the DFA falls back to stepping head sets through the graph's
+    precomputed closures, memoizing at most max_states transitions. The head
+    set of every state is kept so a reload can map processes by their heads.
+    """
+    def __init__(self, graph, function_map, max_states=65536, minimize=True):
+        self.graph = graph
+        self.function_map = function_map
+        self.max_states = max_states
+        self.table = {}
+        self.accepting = set()
+        self.head_counts = []
+        self.state_heads = []
+        self.state_ids = {}
+        self.start = None
+        self.complete = False
+        self._cache = {}
+        self._labels = labels_by_id(function_map)
+        self.end = graph._end[0] if graph._end else None
+
+        self._start_heads = graph.start_heads()
+        self.complete = self.determinize()
+        if self.complete and minimize:
+            self.minimize()
+
+    def determinize(self):
+        self.state_ids = {self._start_heads: 0}
+        self.state_heads = [self._start_heads]
+        self.head_counts = [len(self._start_heads)]
+        self.accepting = {0} if self.end in self._start_heads else set()
+        if not self.explore(0):
+            self.table, self.state_ids, self.state_heads, self.head_counts, self.accepting = {}, {}, [], [], set()
+            return False
+        self.start = 0
+        return True
+
+    def explore(self, i):
+        """Subset construction of the states from i on, False once it would pass max_states."""
+        while i < len(self.state_heads):
+            heads = self.state_heads[i]
+            moves = {}
+            for label in self.graph.labels_from(heads):
+                func_id = self.function_map.get(label)
+                if func_id is not None:
+                    moves.setdefault(func_id, set()).update(self.graph.move(heads, label))
+            for func_id, moved in moves.items():
+                target = self.graph.closure_of(moved)
+                if target not in self.state_ids:
+                    if len(self.state_heads) >= self.max_states:
+                        return False
+                    self.add_state(target)
+                self.table[(i, func_id)] = self.state_ids[target]
+            i += 1
+        return True
+
+    def add_state(self, heads):
+        state = self.state_ids[heads] = len(self.state_heads)
+        self.state_heads.append(heads)
+        self.head_counts.append(len(heads))
+        if self.end in heads:
+            self.accepting.add(state)
+        return state
+
+    def minimize(self):
+        """Moore-style partition refinement; the missing transition is the dead state."""
+        num_states = len(self.head_counts)
+        outgoing = [[] for _ in range(num_states)]
+        for (state, func_id), target in self.table.items():
+            outgoing[state].append((func_id, target))
+
+        block = [1 if state in self.accepting else 0 for state in range(num_states)]
+        num_blocks = len(set(block))
+        while True:
+            signatures = {}
+            new_block = []
+            for state in range(num_states):
+                sig = (block[state], tuple(sorted((func_id, block[t]) for func_id, t in outgoing[state])))
+                new_block.append(signatures.setdefault(sig, len(signatures)))
+            block = new_block
+            if len(signatures) == num_blocks:
+                break
+            num_blocks = len(signatures)
+
+        self.table = {(block[state], func_id): block[target] for (state, func_id), target in self.table.items()}
+        self.start = block[self.start]
+        self.accepting = {block[state] for state in self.accepting}
+        head_counts = [0] * num_blocks
+        for state, count in enumerate(self.head_counts):
+            head_counts[block[state]] = max(head_counts[block[state]], count)
+        self.head_counts = head_counts
+        # every subset still names its block, the first one found stands for the block's heads
+        state_heads = [None] * num_blocks
+        for state, heads in enumerate(self.state_heads):
+            if state_heads[block[state]] is None:
+                state_heads[block[state]] = heads
+        self.state_heads = state_heads
+        self.state_ids = {heads: block[state] for heads, state in self.state_ids.items()}
+
+    def initial_state(self):
+        return self.start if self.complete else self._start_heads
+
+    def step(self, state, func_id):
+        """Return the state reached on func_id, or None if the call is not allowed."""
+        if self.complete:
+            return self.table.get((state, func_id))
+
+        key = (state, func_id)
+        if key in self._cache:
+            return self._cache[key]
+        new_heads = set()
+        for label in self._labels.get(func_id, ()):
+            new_heads |= self.graph.move(state, label)
+        target = self.graph.closure_of(new_heads) if new_heads else None
+        if len(self._cache) >= self.max_states:
+            self._cache.clear()
+        self._cache[key] = target
+        return target
+
+    def heads(self, state):
+        return self.state_heads[state] if self.complete else state
+
+    def state_of(self, heads):
+        """
+        State of the closure of heads. A complete DFA that has no state for
+        that head set yet is extended from it, unminimized; None if that would
+        pass max_states.
+        """
+        heads = self.graph.closure_of(heads)
+        if not self.complete:
+            return heads
+        if heads in self.state_ids:
+            return self.state_ids[heads]
+        num_states = len(self.state_heads)
+        if num_states >= self.max_states:
+            return None
+        state = self.add_state(heads)
+        if not self.explore(state):
+            self.state_ids = {heads: state for heads, state in self.state_ids.items() if state < num_states}
+            del self.state_heads[num_states:], self.head_counts[num_states:]
+            self.accepting = {state for state in self.accepting if state < num_states}
+            self.table = {key: target for key, target in self.table.items() if key[0] < num_states}
+            return None
+        return state
+
+    def is_accepting(self, state):
+        if self.complete:
+            return state in self.accepting
+        return self.end is not None and self.end in state
+
+    def head_count(self, state):
+        return self.head_counts[state] if self.complete else len(state)
+
+    def num_states(self):
+        return len(self.head_counts) if self.complete else len(self._cache)
+
+
+
+class ProcessState:
+    """
+    Automaton state of one sandboxed process and the pending dummy() ID of
+    each of its threads. function_call_list keeps the function IDs of the last
+    history_len steps for the audit log and for replay into a reloaded policy;
+    truncated is set once older calls have been dropped.
+    """
+    def __init__(self, state, history_len=1024):
+        self.state = state
+        self.pending = {}
+        self.function_call_list = deque(maxlen=history_len)
+        self.truncated = False
+
+    def record(self, func_id):
+        if len(self.function_call_list) == self.function_call_list.maxlen:
+            self.truncated = True
+        self.function_call_list.append(func_id)
+
+    def fork(self):
+        """State of a forked child, which inherits the history."""
+        child = ProcessState(self.state, self.function_call_list.maxlen)
+        child.function_call_list.extend(self.function_call_list)
+        child.truncated = self.truncated
+        return child
+
 
 class EBPFTracer:
-    def __init__(self, graph, libc_path, functions_to_trace, function_map, rev_function_map):
+    def __init__(self, graph, libc_path, functions_to_trace, function_map, rev_function_map, dfa, in_kernel=False, ringbuf_pages=2 << 10, cache=None, attach_workers=1, record_path=None, audit=None, metrics=None, exporter=None, symbol_index=None, attach_unused=False, batch_verify=False,
+                 max_processes=10240, max_threads=10240, bound_binaries=(), syscall_only=False, cross_check=0, cross_check_period=10.0,
+                 policy_path=None, build_policy=None, watch_interval=0.0, pool=None, history_len=1024):
         self.graph = graph
         self.libc_path = libc_path
         self.functions_to_trace = functions_to_trace
         self.function_map = function_map
         self.rev_function_map = rev_function_map
+        self.dfa = dfa
+        self.in_kernel = in_kernel
+        self.ringbuf_pages = ringbuf_pages
+        self.cache = cache
+        self.attach_workers = attach_workers
+        self.attach_report = None
+        self.audit = audit if audit is not None else AuditLog(None)
+        self.metrics = metrics
+        self.symbol_index = symbol_index
+        self.attach_unused = attach_unused
+        self.batch_verify = batch_verify
+        self.max_processes = max_processes
+        self.max_threads = max_threads
+        self.bound_binaries = list(bound_binaries)
+        self.syscall_only = syscall_only
+        self.cross_check = cross_check
+        self.cross_check_period = cross_check_period
+        self.cross_check_offsets = {}
+        self.libc_size = 0
+        self.alphabet_functions = []
+        self.policy_path = policy_path
+        self.build_policy = build_policy
+        self.watch_interval = watch_interval
+        self.policy_stat = self.stat_policy()
+        self.reload_requested = False
+        self.reload_thread = None
+        self.reloaded = None
+        self.pool = pool
+        self.history_len = history_len
+        self.func_slots = {}
+        self.probed_slots = set()
+        self.enabled_bits = []
+        self.enabled_functions = set()
+        self.exporter = exporter
+        self.recorder = None
+        if record_path:
+            fp = open(record_path, "wb")
+            fp.write(TRACE_MAGIC)
+            self.recorder = AsyncWriter(fp)
 
         self.bpf = None
-        self.next_func_call = None
-        self.function_call_list = []
+        self.processes = {}
+        self.batch = []
+        self.lost_events = 0
+        self.symbol_addresses = {}
 
     def generate_ebpf_program(self):
         base_program = """
         #include <uapi/linux/ptrace.h>
+        #include <linux/sched.h>
+        #include <linux/sched/signal.h>
+        #include <linux/binfmts.h>
+        #include <linux/fs.h>
+
+        BPF_RINGBUF_OUTPUT(output, RINGBUF_PAGES);
+        BPF_PERCPU_ARRAY(dropped, u64, 1);
+        BPF_HASH(process, u32, u32, MAX_PROCESSES);
+        // per-thread libc nesting depth and pending dummy() ID
+        BPF_HASH(stack, u32, int, MAX_THREADS);
+        BPF_HASH(pending, u32, int, MAX_THREADS);
+        // libc symbol address -> function ID and bit in enabled, and per-process
+        // libc load base, so a single handler pair serves every traced function;
+        // aliases of one address share the entry and the bit
+        struct func_info {
+            u32 func_id;
+            u32 slot;
+        };
+        BPF_HASH(func_ids, u64, struct func_info, MAX_FUNCS);
+        // the anchor fires in every process on the host, their bases wait in an LRU and
+        // move to libc_base when the process registers, so busy hosts cannot evict them
+        BPF_TABLE("lru_hash", u32, u64, libc_base_seen, MAX_PROCESSES);
+        BPF_HASH(libc_base, u32, u64, MAX_PROCESSES);
+        // one bit per probed function, hits of disabled functions only track nesting
+        BPF_ARRAY(enabled, u64, ENABLED_WORDS);
 
-        BPF_PERF_OUTPUT(output);
-        BPF_HASH(process, u32, u32);
-        BPF_ARRAY(stack, int, 10);
+        enum event_kind {
+            EVENT_DUMMY = 1,
+            EVENT_LIBC = 2,
+            EVENT_VIOLATION = 3,
+            EVENT_EXIT = 4,
+            EVENT_FORK = 5,
+            EVENT_EXEC = 6,
+            EVENT_UNANNOUNCED = 7,
+            EVENT_NO_BASE = 8,
+        };
 
-        struct command {
-            char type[64];
-            char func[128];
+        // keep in sync with EVENT_FORMAT in enforce_NFA_ebpf.py
+        struct event {
+            u64 ts;
+            u32 pid;
+            u32 tid;
+            u32 kind;
+            u32 func_id;
             int next_lib_call;
-            int pid;
+            u32 state;
         };
 
+        static void submit_event(struct event *e) {
+            if (output.ringbuf_output(e, sizeof(*e), 0) != 0) {
+                int zero = 0;
+                u64 *count = dropped.lookup(&zero);
+                if (count) (*count)++;
+            }
+        }
+
+        #ifdef IN_KERNEL_ENFORCE
+        // DFA transitions loaded from Python: (state, function ID) -> state
+        struct transition_key {
+            u32 state;
+            u32 func_id;
+        };
+
+        BPF_HASH(transitions, struct transition_key, u32, MAX_TRANSITIONS);
+        BPF_HASH(proc_state, u32, u32, MAX_PROCESSES);
+
+        static int enforce_lib_call(u32 pid, u32 tid, struct event *e) {
+            u32 *state = proc_state.lookup(&pid);
+            int *next_lib_call = pending.lookup(&tid);
+            if (state == NULL) return 0;
+
+            struct transition_key key = {.state = *state, .func_id = next_lib_call ? *next_lib_call : 0};
+            u32 *next = transitions.lookup(&key);
+            e->next_lib_call = key.func_id;
+            e->state = *state;
+            if (next == NULL) {
+                bpf_send_signal(9);
+                e->kind = EVENT_VIOLATION;
+                proc_state.delete(&pid);
+                process.delete(&pid);
+            } else {
+                proc_state.update(&pid, next);
+                e->state = *next;
+            }
+            submit_event(e);
+            return 0;
+        }
+        #endif
+
         TRACEPOINT_PROBE(syscalls, sys_enter_dummy) {
-            u32 pid = bpf_get_current_pid_tgid() >> 32;
+            u64 pid_tgid = bpf_get_current_pid_tgid();
+            u32 pid = pid_tgid >> 32;
+            u32 tid = pid_tgid;
             if (process.lookup(&pid) == NULL) {
                 process.update(&pid, &pid);
+                u64 *base = libc_base_seen.lookup(&pid);
+                if (base) {
+                    libc_base.update(&pid, base);
+                    libc_base_seen.delete(&pid);
+                }
             }
 
-            int zero = 0;
             int init_count = 0;
-            if (stack.lookup(&zero) == NULL) {
-                stack.update(&zero, &init_count);
+            if (stack.lookup(&tid) == NULL) {
+                stack.update(&tid, &init_count);
+            }
+            int value = args->value;
+            pending.update(&tid, &value);
+
+        #ifdef IN_KERNEL_ENFORCE
+            if (proc_state.lookup(&pid) == NULL) {
+                u32 start = DFA_START;
+                proc_state.update(&pid, &start);
+            }
+        #ifdef SYSCALL_ONLY
+            // the announced ID is the call, no uprobe confirms it
+            struct event e = {.ts = bpf_ktime_get_ns(), .pid = pid, .tid = tid, .kind = EVENT_LIBC, .func_id = value};
+            enforce_lib_call(pid, tid, &e);
+        #endif
+        #else
+            struct event e = {.ts = bpf_ktime_get_ns(), .pid = pid, .tid = tid, .kind = EVENT_DUMMY, .next_lib_call = value};
+            submit_event(&e);
+        #endif
+            return 0;
+        }
+
+        TRACEPOINT_PROBE(sched, sched_process_exit) {
+            u64 pid_tgid = bpf_get_current_pid_tgid();
+            u32 pid = pid_tgid >> 32;
+            u32 tid = pid_tgid;
+
+            // the thread's entries go with it even if a kill already dropped its process,
+            // a new thread reusing the tid must start at depth 0
+            stack.delete(&tid);
+            pending.delete(&tid);
+
+            // the process is gone with its last thread, the leader can exit before the others
+            struct task_struct *task = (struct task_struct *)bpf_get_current_task();
+            struct signal_struct *signal = NULL;
+            int live = 1;
+            bpf_probe_read_kernel(&signal, sizeof(signal), &task->signal);
+            if (signal) bpf_probe_read_kernel(&live, sizeof(live), &signal->live.counter);
+            u32 group_dead = live == 0;
+
+            int registered = process.lookup(&pid) != NULL;
+            if (group_dead) {
+                process.delete(&pid);
+                libc_base.delete(&pid);
+                libc_base_seen.delete(&pid);
+        #ifdef IN_KERNEL_ENFORCE
+                proc_state.delete(&pid);
+        #endif
+            }
+            if (!registered) return 0;
+            struct event e = {.ts = bpf_ktime_get_ns(), .pid = pid, .tid = tid, .kind = EVENT_EXIT, .func_id = group_dead};
+            submit_event(&e);
+            return 0;
+        }
+
+        // (device, inode) of executables that run under the policy, see --binary
+        struct binary_key {
+            u32 dev;
+            u64 ino;
+        };
+        BPF_HASH(bound_binaries, struct binary_key, u8, 64);
+
+        RAW_TRACEPOINT_PROBE(sched_process_fork) {
+            struct task_struct *parent = (struct task_struct *)ctx->args[0];
+            struct task_struct *child = (struct task_struct *)ctx->args[1];
+            u32 ppid = 0, cpid = 0, ctid = 0;
+            bpf_probe_read_kernel(&ppid, sizeof(ppid), &parent->tgid);
+            if (process.lookup(&ppid) == NULL) return 0;
+            bpf_probe_read_kernel(&cpid, sizeof(cpid), &child->tgid);
+            bpf_probe_read_kernel(&ctid, sizeof(ctid), &child->pid);
+            // new threads share the process entry and start with an empty call stack
+            if (cpid == ppid) return 0;
+
+            // the child returns from the same libc call as its parent
+            u32 ptid = bpf_get_current_pid_tgid();
+            int *depth = stack.lookup(&ptid);
+            if (depth) stack.update(&ctid, depth);
+            int *next_lib_call = pending.lookup(&ptid);
+            if (next_lib_call) pending.update(&ctid, next_lib_call);
+
+            process.update(&cpid, &cpid);
+            u64 *base = libc_base.lookup(&ppid);
+            if (base) libc_base.update(&cpid, base);
+        #ifdef IN_KERNEL_ENFORCE
+            u32 *state = proc_state.lookup(&ppid);
+            if (state) proc_state.update(&cpid, state);
+        #endif
+            struct event e = {.ts = bpf_ktime_get_ns(), .pid = cpid, .tid = ctid, .kind = EVENT_FORK, .func_id = ppid};
+            submit_event(&e);
+            return 0;
+        }
+
+        RAW_TRACEPOINT_PROBE(sched_process_exec) {
+            u64 pid_tgid = bpf_get_current_pid_tgid();
+            u32 pid = pid_tgid >> 32;
+            u32 tid = pid_tgid;
+            if (process.lookup(&pid) == NULL) return 0;
+
+            // the new image has no call stack and maps libc elsewhere
+            stack.delete(&tid);
+            pending.delete(&tid);
+            libc_base.delete(&pid);
+
+            u32 bound = 1;
+        #ifdef EXEC_FILTER
+            struct linux_binprm *bprm = (struct linux_binprm *)ctx->args[2];
+            struct file *file = NULL;
+            struct inode *inode = NULL;
+            struct super_block *sb = NULL;
+            struct binary_key key = {};
+            bpf_probe_read_kernel(&file, sizeof(file), &bprm->file);
+            if (file) bpf_probe_read_kernel(&inode, sizeof(inode), &file->f_inode);
+            if (inode) {
+                bpf_probe_read_kernel(&key.ino, sizeof(key.ino), &inode->i_ino);
+                bpf_probe_read_kernel(&sb, sizeof(sb), &inode->i_sb);
+            }
+            if (sb) bpf_probe_read_kernel(&key.dev, sizeof(key.dev), &sb->s_dev);
+            // any other image keeps the current state, so its first unannounced call is rejected
+            bound = bound_binaries.lookup(&key) != NULL;
+        #endif
+        #ifdef IN_KERNEL_ENFORCE
+            if (bound) {
+                u32 start = DFA_START;
+                proc_state.update(&pid, &start);
             }
+        #endif
+            struct event e = {.ts = bpf_ktime_get_ns(), .pid = pid, .tid = tid, .kind = EVENT_EXEC, .func_id = bound};
+            submit_event(&e);
+            return 0;
+        }
 
-            struct command c = {.type = "dummy_sys_call", .func = "", .next_lib_call = args->value, .pid = pid};
-            output.perf_submit(args, &c, sizeof(c));
+        int trace_libc_base(struct pt_regs *ctx) {
+            u32 pid = bpf_get_current_pid_tgid() >> 32;
+            u64 base = PT_REGS_IP(ctx) - ANCHOR_ADDR;
+            if (process.lookup(&pid) != NULL) {
+                libc_base.update(&pid, &base);
+            } else {
+                libc_base_seen.update(&pid, &base);
+            }
             return 0;
         }
 
-        static int call_lib_return(u32 pid){
-            // u32 pid = bpf_get_current_pid_tgid();
+        static struct func_info *lookup_func(struct pt_regs *ctx, u32 pid, u32 tid) {
+            u64 *base = libc_base.lookup(&pid);
+            if (base == NULL) {
+                // its base left libc_base_seen before the process registered
+                struct event e = {.ts = bpf_ktime_get_ns(), .pid = pid, .tid = tid, .kind = EVENT_NO_BASE};
+                submit_event(&e);
+                return NULL;
+            }
+
+            u64 addr = PT_REGS_IP(ctx) - *base;
+            struct func_info *info = func_ids.lookup(&addr);
+            if (info == NULL) {
+                // some architectures report the address after the breakpoint
+                addr -= 1;
+                info = func_ids.lookup(&addr);
+            }
+            return info;
+        }
+
+        static int function_enabled(struct func_info *info) {
+            // unresolved hits are reported, the verdict does not depend on the function
+            if (info == NULL) return 1;
+            int word = info->slot / 64;
+            u64 *bits = enabled.lookup(&word);
+            return bits && ((*bits >> (info->slot % 64)) & 1);
+        }
+
+        #ifdef SYSCALL_ONLY
+        // Cross-check of a sampled function: a call from outside libc must have
+        // been announced by dummy() with its ID. On x86-64 the return address is
+        // on top of the stack at function entry.
+        static int check_announced(struct pt_regs *ctx, u32 pid, u32 tid) {
+            struct func_info *info = lookup_func(ctx, pid, tid);
+            if (info == NULL) return 0;
+            u64 *base = libc_base.lookup(&pid);
+            if (base == NULL) return 0;
+            u64 ret = 0;
+            bpf_probe_read_user(&ret, sizeof(ret), (void *)PT_REGS_SP(ctx));
+            if (ret - *base < LIBC_SIZE) return 0;
+
+            int *next_lib_call = pending.lookup(&tid);
+            if (next_lib_call && *next_lib_call == info->func_id) {
+                // one announcement covers one call
+                pending.delete(&tid);
+                return 0;
+            }
+            struct event e = {.ts = bpf_ktime_get_ns(), .pid = pid, .tid = tid, .kind = EVENT_UNANNOUNCED,
+                              .func_id = info->func_id, .next_lib_call = next_lib_call ? *next_lib_call : 0};
+            submit_event(&e);
+            return 0;
+        }
+        #endif
+
+        int trace_lib_enter(struct pt_regs *ctx) {
+            u64 pid_tgid = bpf_get_current_pid_tgid();
+            u32 pid = pid_tgid >> 32;
+            u32 tid = pid_tgid;
+            if (process.lookup(&pid) == NULL) return 0;
+        #ifdef SYSCALL_ONLY
+            return check_announced(ctx, pid, tid);
+        #endif
+
+            int zero = 0; int *st_count = stack.lookup_or_try_init(&tid, &zero);
+            if (st_count) {
+                int depth = *st_count;
+                int nc = depth + 1;
+                stack.update(&tid, &nc);
+                if (depth == 0) {
+                    struct func_info *info = lookup_func(ctx, pid, tid);
+                    if (!function_enabled(info)) return 0;
+                    struct event e = { .ts = bpf_ktime_get_ns(), .pid = pid, .tid = tid, .kind = EVENT_LIBC, .func_id = info ? info->func_id : 0};
+                #ifdef IN_KERNEL_ENFORCE
+                    enforce_lib_call(pid, tid, &e);
+                #else
+                    submit_event(&e);
+                #endif
+                }
+            }
+            return 0;
+        }
+
+        int trace_lib_exit(struct pt_regs *ctx) {
+            u64 pid_tgid = bpf_get_current_pid_tgid();
+            u32 pid = pid_tgid >> 32;
+            u32 tid = pid_tgid;
             if (process.lookup(&pid) == NULL) return 0;
 
-            int zero = 0;
-            int *st_count = stack.lookup(&zero);
-            if (st_count && *st_count > 0) {{
+            int *st_count = stack.lookup(&tid);
+            if (st_count && *st_count > 0) {
                 int new_count = *st_count - 1;
-                stack.update(&zero, &new_count);
-            }}
+                stack.update(&tid, &new_count);
+            }
             return 0;
         }
-        
         """
-        for func in tqdm(self.functions_to_trace, desc="Generating  Program"):
-            trace_function = f"""
-            int trace_lib_{func}_enter(struct pt_regs *ctx) {{
-                u32 pid = bpf_get_current_pid_tgid() >> 32;
-                if (process.lookup(&pid) == NULL) return 0;
-
-                int zero = 0; int *st_count = stack.lookup(&zero);
-                if (st_count) {{
-                    if (*st_count == 0) {{
-                        struct command c = {{ .type = "libc_call", .func = "{func}", .next_lib_call = PT_REGS_IP(ctx), .pid = pid}};
-                        int nc = *st_count + 1;
-                        stack.update(&zero, &nc);
-                        output.perf_submit(ctx, &c, sizeof(c));
-                    }} else {{
-                        int nc = *st_count + 1;
-                        stack.update(&zero, &nc);
-                    }}
-                }}
-                return 0;
-            }}
-
-            int trace_lib_{func}_exit(struct pt_regs *ctx) {{
-                u32 pid = bpf_get_current_pid_tgid();
-                return call_lib_return(pid);
-            }}
-            """
-            base_program += trace_function
         return base_program
 
+    def get_cflags(self):
+        cflags = [
+            f"-DRINGBUF_PAGES={self.ringbuf_pages}",
+            f"-DMAX_FUNCS={max(len(self.symbol_addresses), 1)}",
+            f"-DENABLED_WORDS={len(self.enabled_bits) or 1}",
+            f"-DANCHOR_ADDR={self.symbol_addresses.get(LIBC_ANCHOR, 0)}ULL",
+            f"-DMAX_PROCESSES={self.max_processes}",
+            f"-DMAX_THREADS={self.max_threads}",
+        ]
+        if self.bound_binaries:
+            cflags.append("-DEXEC_FILTER")
+        if self.syscall_only:
+            cflags += ["-DSYSCALL_ONLY", f"-DLIBC_SIZE={self.libc_size}ULL"]
+        if not self.in_kernel:
+            return cflags
+        return cflags + [
+            "-DIN_KERNEL_ENFORCE",
+            f"-DDFA_START={self.dfa.initial_state()}",
+            f"-DMAX_TRANSITIONS={max(len(self.dfa.table), 1)}",
+        ]
+
+    def load_transition_table(self):
+        """Copy the compiled DFA into the kernel-side transitions map."""
+        transitions = self.bpf["transitions"]
+        for (state, func_id), target in self.dfa.table.items():
+            transitions[transitions.Key(state, func_id)] = transitions.Leaf(target)
+        print(f"Loaded {len(self.dfa.table)} transitions into kernel.")
+
+    def load_function_ids(self):
+        """One entry per address; of several aliases, one in the policy alphabet gives the reported function ID."""
+        func_ids = self.bpf["func_ids"]
+        for func in self.probe_functions(self.alphabet_functions):
+            func_ids[func_ids.Key(self.symbol_addresses[func])] = func_ids.Leaf(self.function_map.get(func, 0), self.func_slots[func])
+
+    def probe_functions(self, preferred=()):
+        """One resolved function per distinct address, aliases in preferred first."""
+        preferred = set(preferred)
+        by_slot = {}
+        for func, slot in self.func_slots.items():
+            if slot not in by_slot or (func in preferred and by_slot[slot] not in preferred):
+                by_slot[slot] = func
+        return list(by_slot.values())
+
+    def select_functions(self, graph=None):
+        """Split functions_to_trace into those labelling a policy edge (of graph, default the loaded one) and the rest."""
+        alphabet = (graph or self.graph).alphabet()
+        used = [func for func in self.functions_to_trace if func in alphabet]
+        unused = [func for func in self.functions_to_trace if func not in alphabet]
+        return used, unused
+
+    def set_functions_enabled(self, functions, enabled=True):
+        """
+        Flip the kernel-side enable bit of each function. Probes of disabled
+        functions still fire but only track call nesting, no event is emitted.
+        Aliases share a bit, which stays set while any of them is enabled.
+        """
+        functions = [func for func in functions if func in self.func_slots]
+        if enabled:
+            self.enabled_functions.update(functions)
+        else:
+            self.enabled_functions.difference_update(functions)
+        dirty = {self.func_slots[func] // 64 for func in functions}
+        bits = [0] * len(self.enabled_bits)
+        for func in self.enabled_functions:
+            word, bit = divmod(self.func_slots[func], 64)
+            bits[word] |= 1 << bit
+        enabled_map = self.bpf["enabled"]
+        for word in dirty:
+            self.enabled_bits[word] = bits[word]
+            enabled_map[enabled_map.Key(word)] = enabled_map.Leaf(bits[word])
+
+    def load_bound_binaries(self):
+        """Key every --binary by the kernel encoding of its device and its inode number."""
+        bound = self.bpf["bound_binaries"]
+        for path in self.bound_binaries:
+            st = os.stat(path)
+            dev = (os.major(st.st_dev) << 20) | os.minor(st.st_dev)
+            bound[bound.Key(dev, st.st_ino)] = bound.Leaf(1)
+
+    def read_libc_base(self, pid):
+        """libc load base of pid from /proc/<pid>/maps, None if it has none or is gone."""
+        libc_real_path = os.path.realpath(self.libc_path)
+        try:
+            with open(f"/proc/{pid}/maps", "r") as maps:
+                for line in maps:
+                    fields = line.split()
+                    if len(fields) >= 6 and fields[2] == "00000000" and os.path.realpath(fields[5]) == libc_real_path:
+                        return int(fields[0].split("-")[0], 16)
+        except OSError:
+            pass
+        return None
+
+    def seed_libc_bases(self):
+        """Record libc load base of processes that started before the anchor probe was attached."""
+        libc_base_seen = self.bpf["libc_base_seen"]
+        for pid in filter(str.isdigit, os.listdir("/proc")):
+            base = self.read_libc_base(pid)
+            if base is not None:
+                libc_base_seen[libc_base_seen.Key(int(pid))] = libc_base_seen.Leaf(base)
+
+    def resolve_libc_base(self, pid):
+        """A registered process hit a probe without a known libc base, read it again."""
+        base = self.read_libc_base(pid)
+        self.audit.warning("libc_base_missing", pid=pid, resolved=base is not None)
+        if base is not None:
+            libc_base = self.bpf["libc_base"]
+            libc_base[libc_base.Key(pid)] = libc_base.Leaf(base)
+
+    def get_program_functions(self):
+        """BPF functions of the generated program and their program types, as stored in the cache."""
+        return {
+            "trace_lib_enter": BPF.KPROBE,
+            "trace_lib_exit": BPF.KPROBE,
+            "trace_libc_base": BPF.KPROBE,
+            "tracepoint__syscalls__sys_enter_dummy": BPF.TRACEPOINT,
+            "tracepoint__sched__sched_process_exit": BPF.TRACEPOINT,
+            "raw_tracepoint__sched_process_fork": BPF.RAW_TRACEPOINT,
+            "raw_tracepoint__sched_process_exec": BPF.RAW_TRACEPOINT,
+        }
+
+    def load_program(self):
+        text, cflags = self.generate_ebpf_program(), self.get_cflags()
+        if self.cache is None:
+            self.bpf = BPF(text=text, cflags=cflags)
+            print("Program Loaded.")
+            return
+
+        key = self.cache.key(text, cflags, self.libc_path)
+        self.bpf = self.cache.load(key)
+        if self.bpf is None:
+            self.bpf = BPF(text=text, cflags=cflags)
+            self.cache.store(key, self.bpf, self.get_program_functions())
+            print("Program Loaded.")
+        else:
+            print("Program Loaded from cache.")
+        print(self.cache.report())
+
     def initialize_bpf(self):
-        self.bpf = BPF(text=self.generate_ebpf_program())
-        print("Program Loaded.")
-        for func in tqdm(self.functions_to_trace, desc="Attaching probes"):
-            try:
-                self.bpf.attach_uprobe(name=self.libc_path, sym=func, fn_name=f"trace_lib_{func}_enter")
-                self.bpf.attach_uretprobe(name=self.libc_path, sym=func, fn_name=f"trace_lib_{func}_exit")
-            except Exception as e:
-                print(f"Unable to trace lib: {func}: {e}")
-
-    def process_dummy_sys_call(self, next_func_call, pid):
-        """Handle dummy_sys_call events."""
-        self.next_func_call = self.rev_function_map.get(next_func_call, None)
-        print("-" * 80)
-        print(f"command : dummy_sys_call")
-        print(f"next_lib_call : {next_func_call} {self.next_func_call}\npid : {pid}")
-        print("-" * 80)
-
-    def process_libc_call(self, func, pid):
+        if self.in_kernel and not self.dfa.complete:
+            raise RuntimeError("In-kernel enforcement needs a complete DFA, raise --max-dfa-states")
+        used, _ = self.select_functions()
+        print(f"{len(used)} of {len(self.functions_to_trace)} library functions label policy edges")
+        if self.syscall_only:
+            return self.initialize_syscall_only(used)
+        # every listed function gets a slot, so a reloaded policy can probe new ones
+        self.resolve_functions(self.functions_to_trace)
+        self.alphabet_functions = [func for func in used if func in self.func_slots]
+        # functions outside the alphabet are only probed, disabled, to keep the nesting depth exact
+        probed = self.alphabet_functions + ([func for func in self.func_slots if func not in used] if self.attach_unused else [])
+        self.load_program()
+        if self.in_kernel:
+            self.load_transition_table()
+        self.load_function_ids()
+        self.load_bound_binaries()
+        self.set_functions_enabled(used)
+        self.attach_anchor()
+        self.attach_report = self.attach_functions(probed)
+        print(self.attach_report.summary())
+        print(f"Probed {len(self.probed_slots)} of {len(set(self.func_slots.values()))} library function addresses")
+        for func, reason in self.attach_report.skipped.items():
+            print(f"Unable to trace lib: {func}: {reason}")
+        return self.attach_report
+
+    def attach_functions(self, functions, progress=True):
+        """Probe the functions whose address has no probe yet, one per address, and return the AttachReport."""
+        by_slot = {}
+        for func in functions:
+            slot = self.func_slots.get(func)
+            if slot is not None and slot not in self.probed_slots:
+                by_slot.setdefault(slot, func)
+        report = bulk_attach(
+            self.bpf, self.libc_path, list(by_slot.values()), "trace_lib_enter", "trace_lib_exit",
+            symbol_addresses=self.symbol_addresses, workers=self.attach_workers, progress=progress
+        )
+        self.probed_slots.update(self.func_slots[func] for func in report.attached)
+        return report
+
+    def initialize_syscall_only(self, used):
+        """
+        Syscall-only mode: the automaton steps on the ID passed to dummy(), so no
+        library function is probed. With cross_check, that many functions of the
+        policy alphabet get an entry uprobe that reports calls made from outside
+        libc without a matching dummy(); the sample is rotated every
+        cross_check_period seconds by start_tracing.
+        """
+        if self.cross_check:
+            self.resolve_functions(self.functions_to_trace)
+            self.alphabet_functions = [func for func in used if func in self.func_slots]
+            self.libc_size = max(vaddr + filesz for vaddr, _, filesz in load_segments(self.libc_path))
+        self.load_program()
+        if self.in_kernel:
+            self.load_transition_table()
+        self.load_bound_binaries()
+        if not self.cross_check:
+            print("Syscall-only mode, no library functions probed")
+            return None
+        self.load_function_ids()
+        self.attach_anchor()
+        return self.rotate_cross_check()
+
+    def resolve_functions(self, functions):
+        """Look up the addresses of functions and the anchor, and give each function a slot."""
+        names = list(functions) + [LIBC_ANCHOR]
+        if self.symbol_index:
+            self.symbol_addresses = load_symbol_index(self.symbol_index, self.libc_path, names)
+        else:
+            self.symbol_addresses = resolve_symbol_addresses(self.libc_path, names)
+        # aliases (read and __read, open and open64) share the slot of their address
+        slots = {}
+        self.func_slots = {func: slots.setdefault(self.symbol_addresses[func], len(slots))
+                           for func in functions if func in self.symbol_addresses}
+        self.enabled_bits = [0] * max((len(slots) + 63) // 64, 1)
+
+    def attach_anchor(self):
+        if LIBC_ANCHOR in self.symbol_addresses:
+            self.bpf.attach_uprobe(name=self.libc_path, sym=LIBC_ANCHOR, fn_name="trace_libc_base")
+        else:
+            print(f"{LIBC_ANCHOR} not found in {self.libc_path}, only already running processes are resolved")
+        self.seed_libc_bases()
+
+    def cross_check_rotates(self):
+        return self.syscall_only and 0 < self.cross_check < len(self.alphabet_functions) and self.cross_check_period > 0
+
+    def rotate_cross_check(self):
+        """Move the cross-check uprobes to a new random sample of the policy alphabet."""
+        if self.cross_check_offsets:
+            bulk_detach(self.bpf, self.libc_path, self.cross_check_offsets.values())
+        # one alias per address, a second probe at the same offset would not attach
+        alphabet = set(self.alphabet_functions)
+        candidates = [func for func in self.probe_functions(alphabet) if func in alphabet]
+        sample = random.sample(candidates, min(self.cross_check, len(candidates)))
+        self.attach_report = bulk_attach(
+            self.bpf, self.libc_path, sample, "trace_lib_enter", None,
+            symbol_addresses=self.symbol_addresses, workers=self.attach_workers, progress=False
+        )
+        self.cross_check_offsets = self.attach_report.offsets
+        self.audit.info("cross_check", functions=" ".join(self.attach_report.attached),
+                        skipped=len(self.attach_report.skipped))
+        return self.attach_report
+
+    def stat_policy(self):
+        try:
+            st = os.stat(self.policy_path)
+        except (OSError, TypeError):
+            return None
+        return st.st_ino, st.st_size, st.st_mtime_ns
+
+    def policy_changed(self):
+        """True once per change of the policy file, renames onto it included."""
+        policy_stat = self.stat_policy()
+        if policy_stat is None or policy_stat == self.policy_stat:
+            return False
+        self.policy_stat = policy_stat
+        return True
+
+    def request_reload(self, *_):
+        """SIGHUP handler, the rebuild is started from the poll loop."""
+        self.reload_requested = True
+
+    def start_reload(self):
+        """Build the policy again on a background thread, swap_policy installs it."""
+        if self.reload_thread is not None and self.reload_thread.is_alive():
+            return
+        self.reload_requested = False
+        if self.in_kernel:
+            self.audit.error("policy_reload_failed", path=self.policy_path,
+                             reason="the in-kernel DFA is compiled into the BPF program, restart to change it")
+            return
+        self.reload_thread = threading.Thread(target=self.build_reload, daemon=True)
+        self.reload_thread.start()
+
+    def build_reload(self):
+        """
+        Parse and compile the new policy, nothing else: the probes and the
+        enable bits are only touched by swap_policy on the poll loop. On error
+        the loaded policy stays in place.
+        """
+        start = time.monotonic()
+        try:
+            graph, dfa = self.build_policy(self.policy_path)
+            used, _ = self.select_functions(graph)
+            used = [func for func in used if func in self.func_slots] if self.func_slots else used
+        except Exception as e:
+            self.audit.error("policy_reload_failed", path=self.policy_path, reason=str(e))
+            return
+        self.reloaded = (graph, dfa, used, time.monotonic() - start)
+
+    def replay_history(self, proc, dfa):
+        """State dfa reaches on the calls proc made so far, None if it rejects them."""
+        state = dfa.initial_state()
+        try:
+            for func_id in proc.function_call_list:
+                state = dfa.step(state, func_id)
+                if state is None:
+                    return None
+        except StateOverflow:
+            return None
+        return state
+
+    def map_heads(self, proc, old_dfa, dfa):
+        """State of dfa at the nodes of the new policy named like the heads of proc in old_dfa, None if none is left."""
+        names = (old_dfa.graph.node_name(node) for node in old_dfa.heads(proc.state))
+        heads = {node for node in map(dfa.graph.node_key, names) if node is not None}
+        return dfa.state_of(heads) if heads else None
+
+    def call_names(self, proc):
+        """Names of the calls in the history of proc, for the audit log."""
+        return [self.rev_function_map.get(func_id) for func_id in proc.function_call_list]
+
+    def swap_policy(self):
+        """
+        Install the policy built by build_reload between two batches, see
+        remap_processes. Functions new to the alphabet are probed here, on the
+        poll loop. Functions that left it are disabled, not detached: a thread
+        inside one would never see its return and stay nested.
+        """
+        graph, dfa, used, build_time = self.reloaded
+        self.reloaded = None
+        old_dfa = self.dfa
+        self.graph, self.dfa = graph, dfa
+        attached = 0
+        if self.func_slots and not self.syscall_only:
+            report = self.attach_functions(used, progress=False)
+            attached = len(report.attached)
+            for func, reason in report.skipped.items():
+                self.audit.error("attach_failed", func_call=func, reason=reason)
+            self.set_functions_enabled([func for func in self.alphabet_functions if func not in used], False)
+            self.set_functions_enabled(used)
+        self.alphabet_functions = used
+        if self.pool is not None:
+            # the workers remap the processes of their shards
+            self.pool.reload(graph, dfa)
+            self.audit.info("policy_reload", path=self.policy_path, build_sec=round(build_time, 3),
+                            alphabet=len(used), attached=attached, shards=len(self.pool.workers))
+            return
+        mapped, reset = self.remap_processes(old_dfa, dfa)
+        self.audit.info("policy_reload", path=self.policy_path, build_sec=round(build_time, 3),
+                        alphabet=len(used), attached=attached, mapped=mapped, reset=reset)
+
+    def remap_processes(self, old_dfa, dfa):
+        """
+        Move every process from old_dfa to dfa; return (mapped, reset). A
+        process whose whole history is kept continues from the state it
+        reaches in dfa, one with a truncated history from its heads mapped by
+        node name. A process dfa rejects or that has no head left in it is
+        reset to the initial state.
+        """
+        mapped = reset = 0
+        for pid, proc in self.processes.items():
+            if proc.truncated:
+                state = self.map_heads(proc, old_dfa, dfa)
+            else:
+                state = self.replay_history(proc, dfa)
+            if state is None:
+                self.audit.warning("policy_reset", pid=pid, truncated=proc.truncated,
+                                   call_order=self.call_names(proc))
+                proc.state = dfa.initial_state()
+                proc.function_call_list.clear()
+                proc.truncated = False
+                reset += 1
+            else:
+                proc.state = state
+                mapped += 1
+        return mapped, reset
+
+    def get_process(self, pid):
+        if pid not in self.processes:
+            self.processes[pid] = ProcessState(self.dfa.initial_state(), self.history_len)
+        return self.processes[pid]
+
+    def process_dummy_sys_call(self, next_func_call, pid, tid):
+        """Handle dummy_sys_call events, in syscall-only mode the announced call is verified here."""
+        proc = self.get_process(pid)
+        proc.pending[tid] = next_func_call
+        if self.audit.enabled("debug"):
+            self.audit.debug("dummy_sys_call", pid=pid, tid=tid, next_lib_call=next_func_call,
+                             next_lib_name=self.rev_function_map.get(next_func_call))
+        if self.syscall_only:
+            self.apply_verdict(proc, pid, tid, self.rev_function_map.get(next_func_call), next_func_call,
+                               self.step_process(proc, pid, tid, next_func_call))
+
+    def process_libc_call(self, func, pid, tid):
         """Handle libc_call events."""
-        print("-" * 80)
-        print(f"command : libc_call")
-        print(f"func_call : {func}\npid : {pid}")
-        if not self.graph.check_func_call(self.next_func_call):
-            print(f"Killing process with ID : {pid}")
-            try:
-                os.kill(pid, signal.SIGKILL)
-                print(self.function_call_list)
-                self.function_call_list = []
-                self.graph.reset()
-            except Exception as e:
-                self.function_call_list = []
-                self.graph.reset()
-        # elif func == "exit":
-        #     if self.graph._end[0] in self.graph.get_heads():
-        #         print("-" * 80)
-        #         print("Library Call Order : ", self.function_call_list)
-        #         self.graph.reset()
+        proc = self.get_process(pid)
+        self.audit.debug("libc_call", pid=pid, tid=tid, func_call=func)
+        func_id = proc.pending.get(tid)
+        self.apply_verdict(proc, pid, tid, func, func_id, self.step_process(proc, pid, tid, func_id))
+
+    def step_process(self, proc, pid, tid, func_id):
+        """
+        Step proc on func_id. A matcher state that overflows (PushdownNFA past
+        --max-dfa-states) rejects the call of this process only, the tracer
+        and the other processes carry on.
+        """
+        try:
+            return self.dfa.step(proc.state, func_id)
+        except StateOverflow as e:
+            self.audit.error("matcher_overflow", pid=pid, tid=tid, next_lib_call=func_id, reason=str(e))
+            return None
+
+    def apply_verdict(self, proc, pid, tid, func, func_id, next_state):
+        """Kill on a rejected call, otherwise advance the process and record func_id, the ID it was stepped on."""
+        if next_state is None:
+            self.processes.pop(pid, None)
+            self.kill_process(pid)
+            if self.metrics:
+                self.metrics.kills += 1
+            self.audit.warning("kill", pid=pid, tid=tid, func_call=func, call_order=self.call_names(proc))
         else:
-            self.function_call_list.append(func)
-            if self.graph._end[0] in self.graph.get_heads():
-                print("-" * 80)
-                print("Library Call Order : ", self.function_call_list)
-        print("-" * 80)
+            proc.state = next_state
+            proc.record(func_id)
+            if self.dfa.is_accepting(proc.state) and self.audit.enabled("info"):
+                self.audit.info("end_state", pid=pid, call_order=self.call_names(proc))
+
+    def kill_process(self, pid):
+        try:
+            os.kill(pid, signal.SIGKILL)
+        except Exception as e:
+            self.audit.error("kill_failed", pid=pid, reason=str(e))
+
+    def process_fork(self, pid, tid, parent):
+        """The child continues from the parent's automaton state."""
+        proc = self.processes.get(parent)
+        if proc is None:
+            return
+        self.processes[pid] = proc.fork()
+        self.audit.debug("fork", pid=pid, parent=parent)
 
-    def print_event(self, cpu, data, size):
-        """Dispatch events to appropriate handlers."""
-        event = self.bpf["output"].event(data)
-        type_, func, next_func_call, pid = event.type.decode(), event.func.decode(), event.next_lib_call, event.pid
+    def process_exec(self, pid, tid, bound):
+        """A policy-bound image starts over from the initial state, any other keeps the current one."""
+        proc = self.processes.get(pid)
+        if proc is None:
+            return
+        proc.pending.clear()
+        if bound:
+            self.processes[pid] = ProcessState(self.dfa.initial_state(), self.history_len)
+        self.audit.info("exec", pid=pid, tid=tid, bound=bool(bound))
 
-        if type_ == "dummy_sys_call":
-            self.process_dummy_sys_call(next_func_call, pid)
-        elif type_ == "libc_call":
-            self.process_libc_call(func, pid)
+    def process_exit(self, pid, tid, group_dead):
+        """Drop tracer state of an exited thread, and of its process once its last thread is gone."""
+        if group_dead:
+            self.processes.pop(pid, None)
+        elif pid in self.processes:
+            self.processes[pid].pending.pop(tid, None)
 
+    def process_unannounced(self, func, next_func_call, pid, tid):
+        """
+        Report a cross-checked call that was not announced by dummy(). It is not
+        killed: calls from uninstrumented libraries reach libc without dummy() too.
+        """
+        self.audit.warning("unannounced_call", pid=pid, tid=tid, func_call=func, next_lib_call=next_func_call,
+                           next_lib_name=self.rev_function_map.get(next_func_call))
 
-    def start_tracing(self):
-        self.bpf["output"].open_perf_buffer(self.print_event, page_cnt=2 << 10)
+    def process_kernel_verdict(self, kind, func, next_func_call, pid, state):
+        """Report a verdict already enforced by the kernel (in-kernel mode)."""
+        if kind == EVENT_VIOLATION:
+            if self.metrics:
+                self.metrics.kills += 1
+            self.audit.warning("kernel_kill", pid=pid, func_call=func, next_lib_call=next_func_call,
+                               next_lib_name=self.rev_function_map.get(next_func_call))
+        elif self.dfa.is_accepting(state):
+            self.audit.info("end_state", pid=pid, func_call=func)
+        else:
+            self.audit.debug("libc_call", pid=pid, func_call=func, next_lib_call=next_func_call)
+
+    def collect_event(self, ctx, data, size):
+        """Ring buffer callback: only copy the raw record, decoding happens per batch."""
+        self.batch.append(ctypes.string_at(data, size))
+
+    def handle_event(self, ts, pid, tid, kind, func_id, next_func_call, state):
+        """
+        Dispatch events to appropriate handlers. With metrics, the verdict on a
+        libc call is timed against its dummy() syscall.
+        """
+        metrics = self.metrics
+        if metrics:
+            metrics.observe_event(kind, ts, time.monotonic_ns())
+        if kind == EVENT_EXIT:
+            if metrics:
+                metrics.forget(tid)
+            self.process_exit(pid, tid, func_id)
+        elif kind == EVENT_FORK:
+            self.process_fork(pid, tid, func_id)
+        elif kind == EVENT_EXEC:
+            self.process_exec(pid, tid, func_id)
+        elif kind == EVENT_UNANNOUNCED:
+            self.process_unannounced(self.rev_function_map.get(func_id), next_func_call, pid, tid)
+        elif kind == EVENT_NO_BASE:
+            self.resolve_libc_base(pid)
+        elif self.in_kernel:
+            self.process_kernel_verdict(kind, self.rev_function_map.get(func_id), next_func_call, pid, state)
+        elif kind == EVENT_DUMMY:
+            if metrics:
+                metrics.observe_syscall(tid, ts)
+            self.process_dummy_sys_call(next_func_call, pid, tid)
+            if metrics and self.syscall_only:
+                metrics.observe_verdict(tid, time.monotonic_ns())
+        elif kind == EVENT_LIBC and not self.syscall_only:
+            self.process_libc_call(self.rev_function_map.get(func_id), pid, tid)
+            if metrics:
+                metrics.observe_verdict(tid, time.monotonic_ns())
+
+    def verify_batch(self, events):
+        """
+        Batched form of handle_event for engines with step_many (BitsetNFA).
+        Dummy and exit events are applied in order, libc calls are queued per
+        pid and verified by verify_calls. Fork and exec read the state reached
+        so far, so the queue is verified before them. In syscall-only mode the
+        dummy events are the calls.
+        """
+        now = time.monotonic_ns()
+        calls = {}
+        exits = []
+        for ts, pid, tid, kind, func_id, next_func_call, state in events:
+            if self.metrics:
+                self.metrics.observe_event(kind, ts, now)
+            if kind == EVENT_DUMMY and self.syscall_only:
+                func = self.rev_function_map.get(next_func_call)
+                self.audit.debug("dummy_sys_call", pid=pid, tid=tid, next_lib_call=next_func_call, next_lib_name=func)
+                calls.setdefault(pid, []).append((tid, next_func_call, func, ts if self.metrics else None))
+            elif kind == EVENT_DUMMY:
+                if self.metrics:
+                    self.metrics.observe_syscall(tid, ts)
+                self.process_dummy_sys_call(next_func_call, pid, tid)
+            elif kind == EVENT_LIBC and not self.syscall_only:
+                func = self.rev_function_map.get(func_id)
+                self.audit.debug("libc_call", pid=pid, tid=tid, func_call=func)
+                syscall_ts = self.metrics.pop_syscall(tid) if self.metrics else None
+                calls.setdefault(pid, []).append((tid, self.get_process(pid).pending.get(tid), func, syscall_ts))
+            elif kind in (EVENT_FORK, EVENT_EXEC):
+                self.verify_calls(calls)
+                calls = {}
+                if kind == EVENT_FORK:
+                    self.process_fork(pid, tid, func_id)
+                else:
+                    self.process_exec(pid, tid, func_id)
+            elif kind == EVENT_EXIT:
+                exits.append((pid, tid, func_id))
+            elif kind == EVENT_UNANNOUNCED:
+                self.process_unannounced(self.rev_function_map.get(func_id), next_func_call, pid, tid)
+            elif kind == EVENT_NO_BASE:
+                self.resolve_libc_base(pid)
+
+        self.verify_calls(calls)
+        for pid, tid, group_dead in exits:
+            self.process_exit(pid, tid, group_dead)
+
+    def verify_calls(self, calls):
+        """
+        Verify queued libc calls ({pid: [(tid, func_id, func, syscall_ts)]}) in
+        rounds: round r takes the r-th call of every pid and advances all pids
+        calling the same function with one step_many.
+        """
+        r = 0
+        while calls:
+            by_func = {}
+            for pid, queued in calls.items():
+                by_func.setdefault(queued[r][1], []).append(pid)
+            for func_id, pids in by_func.items():
+                procs = [self.get_process(pid) for pid in pids]
+                for pid, proc, next_state in zip(pids, procs, self.dfa.step_many([proc.state for proc in procs], func_id)):
+                    tid, _, func, syscall_ts = calls[pid][r]
+                    self.apply_verdict(proc, pid, tid, func, func_id, next_state)
+                    if self.metrics:
+                        self.metrics.observe_verdict_since(syscall_ts, time.monotonic_ns())
+                    if next_state is None:
+                        del calls[pid]
+            r += 1
+            calls = {pid: queued for pid, queued in calls.items() if len(queued) > r}
+
+    def publish_metrics(self):
+        if self.metrics and self.exporter:
+            self.exporter.publish(self.metrics.render(self, EVENT_NAMES))
+
+    def drain_batch(self):
+        batch, self.batch = self.batch, []
+        if self.recorder and batch:
+            self.recorder.write(b"".join(batch))
+        if self.pool is not None:
+            self.pool.submit(batch, self.observe_shipped)
+            self.handle_worker_results()
+            return len(batch)
+        if self.batch_verify and not self.in_kernel:
+            self.verify_batch([EVENT_FORMAT.unpack(record) for record in batch])
+            return len(batch)
+        for record in batch:
+            self.handle_event(*EVENT_FORMAT.unpack(record))
+        return len(batch)
+
+    def observe_shipped(self, event):
+        """Reader's look at an event shipped to a worker: libc bases are resolved here, workers have no maps."""
+        ts, pid, _, kind, _, _, _ = event
+        if kind == EVENT_NO_BASE:
+            self.resolve_libc_base(pid)
+        if self.metrics:
+            self.metrics.observe_event(kind, ts, time.monotonic_ns())
+
+    def handle_worker_results(self):
+        """Carry out the kills the verification workers asked for and write their audit records."""
+        for result in self.pool.results_ready():
+            if result[0] == "kill":
+                self.kill_process(result[1])
+                if self.metrics:
+                    self.metrics.kills += 1
+            else:
+                _, level, event, fields = result
+                self.audit.log(level, event, **fields)
+
+    def check_workers(self):
+        """Stop tracing once a verification worker has died, the state of its pids is gone with it."""
+        dead = self.pool.dead_workers()
+        for shard in dead:
+            self.audit.error("worker_exited", shard=shard, exitcode=self.pool.workers[shard].exitcode)
+        if dead:
+            raise RuntimeError(f"verification workers {dead} exited, their processes are no longer enforced")
+
+    def update_lost_events(self):
+        """Read the per-CPU count of records the kernel failed to reserve in the ring buffer."""
+        lost = sum(self.bpf["dropped"][ctypes.c_int(0)])
+        if lost > self.lost_events:
+            self.audit.warning("lost_events", lost=lost - self.lost_events, total=lost)
+            self.lost_events = lost
+            if self.metrics:
+                self.metrics.lost_events = lost
+
+    def start_tracing(self, lost_check_interval=1.0, metrics_interval=5.0):
+        """Poll loop. Verdicts are computed inline, all reporting goes through the background writers."""
+        self.bpf["output"].open_ring_buffer(self.collect_event)
         print("Ready for Tracing")
-        while True:
-            self.bpf.perf_buffer_poll(5)
+        last_check = last_publish = last_rotate = last_watch = time.monotonic()
+        try:
+            while True:
+                self.bpf.ring_buffer_poll(5)
+                self.drain_batch()
+                if time.monotonic() - last_check >= lost_check_interval:
+                    self.update_lost_events()
+                    if self.pool is not None:
+                        self.check_workers()
+                    last_check = time.monotonic()
+                if time.monotonic() - last_publish >= metrics_interval:
+                    self.publish_metrics()
+                    last_publish = time.monotonic()
+                if self.cross_check_rotates() and time.monotonic() - last_rotate >= self.cross_check_period:
+                    self.rotate_cross_check()
+                    last_rotate = time.monotonic()
+                if self.watch_interval and time.monotonic() - last_watch >= self.watch_interval:
+                    self.reload_requested |= self.policy_changed()
+                    last_watch = time.monotonic()
+                if self.reload_requested:
+                    self.start_reload()
+                if self.reloaded:
+                    self.swap_policy()
+        finally:
+            self.close()
 
+    def close(self):
+        """Stop the verification workers, flush the audit log and the recorded trace."""
+        if self.pool is not None:
+            self.pool.close()
+            self.handle_worker_results()
+        self.audit.close()
+        if self.recorder:
+            self.recorder.close()
+            self.recorder.fp.close()
+            if self.recorder.dropped:
+                print(f"Recorder dropped {self.recorder.dropped} batches", file=sys.stderr)
 
 if __name__ == "__main__":
     # Set up command-line arguments
     parser = argparse.ArgumentParser(description="eBPF Tracer for library calls")
-    parser.add_argument(
-        "--dot-file", type=str, required=True,
+    policy_group = parser.add_mutually_exclusive_group(required=True)
+    policy_group.add_argument(
+        "--dot-file", type=str,
         help="Path to the DOT file representing the graph."
     )
+    policy_group.add_argument(
+        "--policy", type=str,
+        help="Path to the compiled policy (graph.policy) written by txtToDotConvert.py."
+    )
     parser.add_argument(
         "--function-map", type=str, required=True,
         help="Path to the function map file (e.g., library_functions.txt)."
@@ -307,24 +1607,212 @@ if __name__ == "__main__":
         "--libc-path", type=str, default="/lib/x86_64-linux-gnu/libc.so.6",
         help="Path to the libc library (default: /lib/x86_64-linux-gnu/libc.so.6)."
     )
+    parser.add_argument(
+        "--attach-unused", action="store_true",
+        help="Also probe listed functions that label no policy edge, disabled in BPF, so calls they make internally are not reported."
+    )
+    parser.add_argument(
+        "--symbol-index", type=str, default=None,
+        help="Symbol index written by scripts/extract.py (library_functions.idx), used instead of reading the libc symbol table."
+    )
+    parser.add_argument(
+        "--max-dfa-states", type=int, default=65536,
+        help="Upper bound on determinized states before falling back to closure-based NFA stepping (default: 65536)."
+    )
+    parser.add_argument(
+        "--max-processes", type=int, default=10240,
+        help="Capacity of the per-process BPF maps, forked workers of a sandboxed server each take an entry (default: 10240)."
+    )
+    parser.add_argument(
+        "--max-threads", type=int, default=10240,
+        help="Capacity of the per-thread BPF maps (default: 10240)."
+    )
+    parser.add_argument(
+        "--binary", type=str, action="append", default=[],
+        help="Executable instrumented for this policy, may be repeated. A traced process that execs one starts over from "
+             "the initial state, any other image keeps the current state. Without --binary every exec resets the state."
+    )
+    parser.add_argument(
+        "--engine", type=str, default="dfa", choices=["dfa", "bitset", "pushdown"],
+        help="Policy matcher: the compiled DFA, a NumPy bitset NFA that verifies each drained batch with vectorized steps, "
+             "for policies whose DFA is too large, or a pushdown matcher that only returns to the calling site (default: dfa)."
+    )
+    parser.add_argument(
+        "--max-call-depth", type=int, default=32,
+        help="Library calls' worth of pending calls kept per process by --engine pushdown, returns below them are matched loosely (default: 32)."
+    )
+    parser.add_argument(
+        "--in-kernel", action="store_true",
+        help="Enforce the DFA inside BPF and kill with bpf_send_signal; Python only prints audit events."
+    )
+    parser.add_argument(
+        "--syscall-only", action="store_true",
+        help="Advance the automaton on the ID passed to dummy() and probe no library function, one trap per call instead of three."
+    )
+    parser.add_argument(
+        "--cross-check", type=int, default=0,
+        help="With --syscall-only, probe this many randomly chosen policy functions and report calls to them that skipped dummy() (default: 0)."
+    )
+    parser.add_argument(
+        "--cross-check-period", type=float, default=10.0,
+        help="Seconds between moving the --cross-check probes to a new sample, 0 keeps the first sample (default: 10)."
+    )
+    parser.add_argument(
+        "--watch-policy", type=float, default=0.0,
+        help="Check the policy file every this many seconds and reload it when it changes; SIGHUP always reloads it (default: 0, off)."
+    )
+    parser.add_argument(
+        "--reload-history", type=int, default=1024,
+        help="Calls kept per process to replay into a reloaded policy; a process with a longer history is mapped "
+             "by the names of its current nodes instead (default: 1024)."
+    )
+    parser.add_argument(
+        "--workers", type=int, default=0,
+        help="Verify in this many worker processes, each owning the automaton state of a shard of the pids; "
+             "the poll loop only reads, routes and kills (default: 0, verify inline)."
+    )
+    parser.add_argument(
+        "--ringbuf-pages", type=int, default=2 << 10,
+        help="Size of the BPF ring buffer in pages, must be a power of two (default: 2048)."
+    )
+    parser.add_argument(
+        "--bpf-cache-dir", type=str, default=os.path.expanduser("~/.cache/enforce_NFA_ebpf"),
+        help="Directory caching compiled BPF programs across restarts (default: ~/.cache/enforce_NFA_ebpf)."
+    )
+    parser.add_argument(
+        "--no-bpf-cache", action="store_true",
+        help="Always compile the BPF program with clang."
+    )
+    parser.add_argument(
+        "--bpf-cache-entries", type=int, default=16,
+        help="Number of compiled BPF programs kept in the cache, least recently used first out (default: 16)."
+    )
+    parser.add_argument(
+        "--attach-workers", type=int, default=1,
+        help="Threads attaching uprobe batches in parallel (default: 1)."
+    )
+    parser.add_argument(
+        "--record", type=str, default=None,
+        help="Also write every received event to this file for offline replay (replay.py, benchmark.py)."
+    )
+    parser.add_argument(
+        "--log-level", type=str, default="info", choices=list(LOG_LEVELS),
+        help="Audit records to write: debug logs every event, info end states, warning kills (default: info)."
+    )
+    parser.add_argument(
+        "--log-format", type=str, default="text", choices=["text", "json"],
+        help="Audit record format, json writes one JSON object per line (default: text)."
+    )
+    parser.add_argument(
+        "--log-file", type=str, default=None,
+        help="Write audit records to this file instead of stdout."
+    )
+    parser.add_argument(
+        "--log-queue-size", type=int, default=65536,
+        help="Audit records buffered for the background writer before new ones are dropped (default: 65536)."
+    )
+    parser.add_argument(
+        "--metrics-file", type=str, default=None,
+        help="Periodically rewrite this file with metrics in Prometheus text format (e.g. for the node_exporter textfile collector)."
+    )
+    parser.add_argument(
+        "--metrics-socket", type=str, default=None,
+        help="Serve the same metrics text to every connection on this Unix socket."
+    )
+    parser.add_argument(
+        "--metrics-interval", type=float, default=5.0,
+        help="Seconds between metrics updates (default: 5)."
+    )
 
     args = parser.parse_args()
+    if args.cross_check and not args.syscall_only:
+        parser.error("--cross-check needs --syscall-only")
+
+    if args.engine != "dfa" and args.in_kernel:
+        parser.error("--in-kernel needs --engine dfa")
+    if args.workers and args.in_kernel:
+        parser.error("--workers verifies in user space, it cannot be combined with --in-kernel")
 
     # Load data and initialize components
-    graph = Graph(dot_file=args.dot_file)
     data_loader = DataLoader(args.function_map, args.library_functions)
     function_map, rev_function_map = data_loader.get_lib_function_map()
     functions_to_trace = data_loader.get_library_function_called()
     # functions_to_trace = [ func for func in function_map.keys() if not func.startswith("_")]
+    policy_path = args.policy or args.dot_file
+
+    def build_policy(path):
+        """Graph and matcher of the policy at path, also used to reload it."""
+        graph = PolicyGraph(path) if args.policy else Graph(dot_file=path)
+        if graph.elided and not args.syscall_only:
+            raise ValueError(f"{path} was built with --elide-dummies, its elided call sites are only announced "
+                             "by dummy(), enforce it with --syscall-only")
+        if graph.elided and args.cross_check:
+            raise ValueError(f"{path} was built with --elide-dummies, --cross-check would report every call at "
+                             "an elided site as unannounced")
+        if args.engine == "bitset":
+            return graph, BitsetNFA(graph, function_map)
+        if args.engine == "pushdown":
+            return graph, PushdownNFA(graph, function_map, max_depth=args.max_call_depth, max_states=args.max_dfa_states)
+        return graph, DFA(graph, function_map, max_states=args.max_dfa_states)
+
+    try:
+        graph, dfa = build_policy(policy_path)
+    except (ValueError, StateOverflow) as e:
+        parser.error(str(e))
+    if args.engine == "bitset":
+        print(f"Built bitset NFA over {dfa.num_states()} nodes, {len(dfa.matrices)} function matrices.")
+    elif args.engine == "pushdown":
+        print(f"Built pushdown matcher, {len(dfa._summaries)} function summaries, call depth {args.max_call_depth}.")
+    elif dfa.complete:
+        print(f"Compiled policy to DFA with {dfa.num_states()} states, {len(dfa.table)} transitions.")
+    else:
+        print(f"DFA exceeded {args.max_dfa_states} states, falling back to NFA stepping.")
 
     # Set up and start the tracer
+    audit = AuditLog(open(args.log_file, "a") if args.log_file else sys.stdout,
+                     level=args.log_level, fmt=args.log_format, max_queue=args.log_queue_size)
+    metrics, exporter = None, None
+    if args.metrics_file or args.metrics_socket:
+        metrics = TracerMetrics()
+        exporter = MetricsExporter(args.metrics_file, args.metrics_socket)
+    pool = None
+    if args.workers:
+        # shard_workers imports this module, only needed with --workers
+        from shard_workers import ShardPool
+        pool = ShardPool(args.workers, graph, function_map, rev_function_map, dfa, level=args.log_level,
+                         batch_verify=args.engine == "bitset", syscall_only=args.syscall_only,
+                         history_len=args.reload_history)
     tracer = EBPFTracer(
         graph=graph,
         libc_path=args.libc_path,
         functions_to_trace=functions_to_trace,
         function_map=function_map,
-        rev_function_map=rev_function_map
+        rev_function_map=rev_function_map,
+        dfa=dfa,
+        in_kernel=args.in_kernel,
+        ringbuf_pages=args.ringbuf_pages,
+        cache=None if args.no_bpf_cache else BPFProgramCache(args.bpf_cache_dir, args.bpf_cache_entries),
+        attach_workers=args.attach_workers,
+        record_path=args.record,
+        audit=audit,
+        metrics=metrics,
+        exporter=exporter,
+        symbol_index=args.symbol_index,
+        attach_unused=args.attach_unused,
+        batch_verify=args.engine == "bitset",
+        max_processes=args.max_processes,
+        max_threads=args.max_threads,
+        bound_binaries=args.binary,
+        syscall_only=args.syscall_only,
+        cross_check=args.cross_check,
+        cross_check_period=args.cross_check_period,
+        policy_path=policy_path,
+        build_policy=build_policy,
+        watch_interval=args.watch_policy,
+        pool=pool,
+        history_len=args.reload_history
     )
+    signal.signal(signal.SIGHUP, tracer.request_reload)
     tracer.initialize_bpf()
-    tracer.start_tracing()
+    tracer.start_tracing(metrics_interval=args.metrics_interval)
     # BCC_PROBE_LIMIT = 50000
\ No newline at end of file
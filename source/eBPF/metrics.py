@@ -0,0 +1,143 @@
+import os
+import socket
+import bisect
+import threading
+
+# Upper bounds in seconds, 1us to ~16s in powers of two
+LATENCY_BUCKETS = [1e-6 * (1 << i) for i in range(25)]
+
+
+class Histogram:
+    """Prometheus style histogram, observe() is a bisect and two additions."""
+    def __init__(self, name, help_text, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            lines.append(f'{self.name}_bucket{{le="{bound:.6g}"}} {cumulative}')
+        cumulative += self.counts[-1]
+        lines.append(f'{self.name}_bucket{{le="+Inf"}} {cumulative}')
+        lines.append(f"{self.name}_sum {self.sum:.9f}")
+        lines.append(f"{self.name}_count {cumulative}")
+        return lines
+
+
+class TracerMetrics:
+    """
+    Counters and latency histograms of EBPFTracer.
+
+    Event timestamps come from bpf_ktime_get_ns (CLOCK_MONOTONIC), so they are
+    compared against time.monotonic_ns() taken when Python handles the event.
+    """
+    def __init__(self):
+        self.events = {}
+        self.kills = 0
+        self.lost_events = 0
+        self.event_lag = Histogram("enforce_event_lag_seconds",
+                                   "Time from the kernel event to its handling in the tracer.")
+        self.verdict_latency = Histogram("enforce_verdict_latency_seconds",
+                                         "Time from a dummy() syscall to the verdict on the library call it announced.")
+        self._syscall_ts = {}
+
+    def observe_event(self, kind, ts, now_ns):
+        self.events[kind] = self.events.get(kind, 0) + 1
+        self.event_lag.observe((now_ns - ts) / 1e9)
+
+    def observe_syscall(self, tid, ts):
+        self._syscall_ts[tid] = ts
+
+    def observe_verdict(self, tid, now_ns):
+        self.observe_verdict_since(self.pop_syscall(tid), now_ns)
+
+    def pop_syscall(self, tid):
+        return self._syscall_ts.pop(tid, None)
+
+    def observe_verdict_since(self, ts, now_ns):
+        if ts is not None:
+            self.verdict_latency.observe((now_ns - ts) / 1e9)
+
+    def forget(self, tid):
+        self._syscall_ts.pop(tid, None)
+
+    def render(self, tracer, event_names):
+        """Prometheus text exposition of the metrics and the per-pid state of tracer."""
+        lines = ["# HELP enforce_events_total Events received from the kernel.", "# TYPE enforce_events_total counter"]
+        for kind, count in sorted(self.events.items()):
+            lines.append(f'enforce_events_total{{kind="{event_names.get(kind, kind)}"}} {count}')
+        lines += ["# HELP enforce_kills_total Processes killed for violating the policy.", "# TYPE enforce_kills_total counter",
+                  f"enforce_kills_total {self.kills}"]
+        lines += ["# HELP enforce_lost_events_total Events the kernel could not reserve in the ring buffer.",
+                  "# TYPE enforce_lost_events_total counter", f"enforce_lost_events_total {self.lost_events}"]
+        lines += ["# HELP enforce_audit_dropped_total Audit records dropped because the writer queue was full.",
+                  "# TYPE enforce_audit_dropped_total counter"]
+        for level, count in tracer.audit.dropped.items():
+            lines.append(f'enforce_audit_dropped_total{{level="{level}"}} {count}')
+        lines += ["# HELP enforce_processes Processes with automaton state in the tracer.", "# TYPE enforce_processes gauge",
+                  f"enforce_processes {len(tracer.processes)}"]
+        lines += ["# HELP enforce_heads Size of the NFA head set of each traced process.", "# TYPE enforce_heads gauge"]
+        for pid, proc in list(tracer.processes.items()):
+            lines.append(f'enforce_heads{{pid="{pid}"}} {tracer.dfa.head_count(proc.state)}')
+        lines += self.event_lag.render()
+        lines += self.verdict_latency.render()
+        return "\n".join(lines) + "\n"
+
+
+class MetricsExporter:
+    """
+    Publishes rendered metrics without blocking the caller: a file that is
+    rewritten atomically by a background thread, and/or a Unix socket that
+    answers every connection with the latest text.
+    """
+    def __init__(self, file_path=None, socket_path=None):
+        self.file_path = file_path
+        self.socket_path = socket_path
+        self.text = ""
+        self._lock = threading.Lock()
+        self._updated = threading.Event()
+        if file_path:
+            threading.Thread(target=self._write_file, daemon=True).start()
+        if socket_path:
+            if os.path.exists(socket_path):
+                os.unlink(socket_path)
+            self._server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self._server.bind(socket_path)
+            self._server.listen(8)
+            threading.Thread(target=self._serve, daemon=True).start()
+
+    def publish(self, text):
+        with self._lock:
+            self.text = text
+        self._updated.set()
+
+    def _write_file(self):
+        while True:
+            self._updated.wait()
+            self._updated.clear()
+            with self._lock:
+                text = self.text
+            tmp_path = self.file_path + ".tmp"
+            with open(tmp_path, "w") as fp:
+                fp.write(text)
+            os.replace(tmp_path, self.file_path)
+
+    def _serve(self):
+        while True:
+            conn, _ = self._server.accept()
+            with conn:
+                with self._lock:
+                    text = self.text
+                try:
+                    conn.sendall(text.encode())
+                except OSError:
+                    pass
@@ -0,0 +1,113 @@
+import sys
+import mmap
+import struct
+
+# Compiled policy artifact written by scripts/txtToDotConvert.py (exportPolicy).
+# All integers are little-endian u32, laid out one after another:
+#   header         magic, version, num_nodes, num_labels, num_eps_edges, num_lib_edges, start, num_ends,
+#                  num_closures, closure_size, blob_size, flags (POLICY_FLAG_*)
+#   eps_row_ptr    num_nodes + 1     CSR offsets into the epsilon edge arrays (e, call_, ret_, recursion)
+#   eps_dst        num_eps_edges     destination node ID
+#   eps_label      num_eps_edges     label ID
+#   lib_row_ptr    num_nodes + 1     CSR offsets into the library call edge arrays
+#   lib_dst        num_lib_edges     destination node ID
+#   lib_label      num_lib_edges     label ID
+#   ends           num_ends          end state node IDs
+#   closure_id     num_nodes         epsilon closure of each node, nodes of one epsilon cycle share it
+#   closure_ptr    num_closures + 1  offsets into closure_nodes
+#   closure_nodes  closure_size      node IDs of every closure
+#   node_names     num_nodes + 1     offsets into blob
+#   label_names    num_labels + 1    offsets into blob
+#   blob           blob_size         utf-8 node and label names
+POLICY_MAGIC = b"NFAPOLCY"
+POLICY_VERSION = 3
+POLICY_HEADER = struct.Struct("<8sIIIIIIIIIII")
+# redundant dummy() sites were elided (txtToDotConvert.py --elide-dummies), enforce with --syscall-only
+POLICY_FLAG_ELIDED = 1
+
+
+class PolicyArtifact:
+    """
+    Read-only, memory-mapped view of a compiled policy; arrays are not copied.
+    data (the file contents) is used instead of mapping path, pickling sends
+    the contents so a verification worker sees the policy that was loaded
+    even if the file has been replaced since.
+    """
+    def __init__(self, path=None, data=None):
+        if sys.byteorder != "little":
+            raise RuntimeError("Policy artifacts are little-endian, unsupported host byte order")
+        if data is not None:
+            self._mm = data
+        else:
+            with open(path, "rb") as fp:
+                self._mm = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version = struct.unpack_from("<8sI", self._mm, 0)
+        if magic != POLICY_MAGIC:
+            raise ValueError(f"{path} is not a compiled policy")
+        if version != POLICY_VERSION:
+            raise ValueError(f"{path} has policy version {version}, expected {POLICY_VERSION}, rebuild it with txtToDotConvert.py")
+        (_, _, num_nodes, num_labels, num_eps_edges, num_lib_edges, start, num_ends,
+         num_closures, closure_size, blob_size, flags) = POLICY_HEADER.unpack_from(self._mm, 0)
+
+        self.num_nodes = num_nodes
+        self.num_labels = num_labels
+        self.num_edges = num_eps_edges + num_lib_edges
+        self.start = start
+        self.elided = bool(flags & POLICY_FLAG_ELIDED)
+
+        view = memoryview(self._mm)
+        offset = POLICY_HEADER.size
+
+        def take(count):
+            nonlocal offset
+            array = view[offset:offset + 4 * count].cast("I")
+            offset += 4 * count
+            return array
+
+        self.eps_row_ptr = take(num_nodes + 1)
+        self.eps_dst = take(num_eps_edges)
+        self.eps_label = take(num_eps_edges)
+        self.lib_row_ptr = take(num_nodes + 1)
+        self.lib_dst = take(num_lib_edges)
+        self.lib_label = take(num_lib_edges)
+        self.ends = take(num_ends)
+        self.closure_id = take(num_nodes)
+        self.closure_ptr = take(num_closures + 1)
+        self.closure_nodes = take(closure_size)
+        self._node_name_off = take(num_nodes + 1)
+        self._label_name_off = take(num_labels + 1)
+        self._blob = view[offset:offset + blob_size]
+
+    def __reduce__(self):
+        return PolicyArtifact, (None, bytes(self._mm))
+
+    def _string(self, offsets, i):
+        return bytes(self._blob[offsets[i]:offsets[i + 1]]).decode()
+
+    def node_name(self, node):
+        return self._string(self._node_name_off, node)
+
+    def label_name(self, label):
+        return self._string(self._label_name_off, label)
+
+    def node_names(self):
+        return [self.node_name(i) for i in range(self.num_nodes)]
+
+    def label_names(self):
+        return [self.label_name(i) for i in range(self.num_labels)]
+
+    def epsilon_edges(self, node):
+        """(dst, label) ID pairs of the epsilon edges leaving node."""
+        lo, hi = self.eps_row_ptr[node], self.eps_row_ptr[node + 1]
+        return zip(self.eps_dst[lo:hi], self.eps_label[lo:hi])
+
+    def library_edges(self, node):
+        """(dst, label) ID pairs of the library call edges leaving node."""
+        lo, hi = self.lib_row_ptr[node], self.lib_row_ptr[node + 1]
+        return zip(self.lib_dst[lo:hi], self.lib_label[lo:hi])
+
+    def closure(self, node):
+        """Node IDs of the epsilon closure of node, node included."""
+        closure = self.closure_id[node]
+        return self.closure_nodes[self.closure_ptr[closure]:self.closure_ptr[closure + 1]]
@@ -0,0 +1,299 @@
+import os
+import sys
+import json
+import random
+import argparse
+
+from enforce_NFA_ebpf import DataLoader, Graph, PolicyGraph, DFA
+from policy_format import POLICY_HEADER
+from bitset_nfa import BitsetNFA, np
+
+# the converter is a standalone script in scripts/, not a package
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "scripts"))
+try:
+    from txtToDotConvert import Graph as ConverterGraph
+except ImportError:
+    ConverterGraph = None
+
+# Approximate size of struct htab_elem (hash node, hash, padding) in front of each BPF hash map entry
+BPF_HTAB_ELEM_OVERHEAD = 48
+# One entry of the --in-kernel transitions map: struct transition_key (u32 state, u32 func_id) -> u32 state
+BPF_TRANSITION_KEY_SIZE = 8
+BPF_TRANSITION_VALUE_SIZE = 4
+BPF_TRANSITION_BYTES = BPF_HTAB_ELEM_OVERHEAD + BPF_TRANSITION_KEY_SIZE + BPF_TRANSITION_VALUE_SIZE
+
+# Metrics compared against --baseline, a higher value is a regression and so is losing a value
+# (None when the DFA no longer fits in --max-dfa-states)
+GATED_METRICS = [
+    "closure.max", "closure.mean", "heads.worst_case", "heads.expected.mean", "work.expected.mean",
+    "reachability.unreachable_count", "reachability.dead_count", "dfa.states",
+    "memory.graph_bytes", "memory.dfa_bytes", "memory.policy_bytes", "memory.bpf_transitions_bytes",
+]
+# Flags compared against --baseline, going from true to false is a regression
+GATED_FLAGS = ["dfa.complete"]
+
+
+def deep_size(obj, seen=None):
+    """sys.getsizeof of obj and everything it holds, shared objects counted once."""
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_size(k, seen) + deep_size(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_size(item, seen) for item in obj)
+    return size
+
+
+def graph_bytes(graph):
+    """Python objects of the loaded graph, plus the mapped file of a compiled policy."""
+    size = deep_size([graph._label_edges, graph._closures])
+    if isinstance(graph, PolicyGraph):
+        return size + len(graph.artifact._mm)
+    return size + deep_size(graph._graph)
+
+
+def distribution(values):
+    values = sorted(values)
+    if not values:
+        return {"count": 0}
+
+    def at(fraction):
+        return values[min(len(values) - 1, int(len(values) * fraction))]
+
+    return {"count": len(values), "min": values[0], "mean": round(sum(values) / len(values), 3),
+            "p50": at(0.50), "p90": at(0.90), "p99": at(0.99), "max": values[-1]}
+
+
+def function_of(node):
+    """Nodes are named <function>_<number>."""
+    return node.rpartition("_")[0] or node
+
+
+def converter_graph(graph):
+    """The linked policy as the converter's Graph, which only follows "e" edges in its closures."""
+    cgraph = ConverterGraph("policy")
+    for src in graph.nodes():
+        for dst, label in graph.edges(src):
+            cgraph.addEdge(graph.node_name(src), graph.node_name(dst), label)
+    return cgraph
+
+
+def profile_closures(graph, cgraph, top):
+    sizes = {graph.node_name(node): len(graph.closure(node)) for node in graph.nodes()}
+    result = distribution(sizes.values())
+    result["largest"] = [[node, size] for node, size in sorted(sizes.items(), key=lambda item: (-item[1], item[0]))[:top]]
+
+    functions = {}
+    for node, (name, size) in zip(graph.nodes(), sizes.items()):
+        stats = functions.setdefault(function_of(name), {"nodes": 0, "edges": 0, "max_closure": 0, "closure_sum": 0})
+        stats["nodes"] += 1
+        stats["edges"] += len(graph.edges(node))
+        stats["max_closure"] = max(stats["max_closure"], size)
+        stats["closure_sum"] += size
+    for stats in functions.values():
+        stats["mean_closure"] = round(stats.pop("closure_sum") / stats["nodes"], 3)
+
+    local = None
+    if cgraph is not None:
+        # closures without crossing call_/ret_ edges, the gap to the linked closures is what linking costs
+        closures = {}
+        local = distribution(len(cgraph.epsilonClosure(node, closures)) for node in cgraph._nodes)
+    return result, local, functions
+
+
+def profile_fanout(graph):
+    """Per label: edges, source nodes, the most targets a single source has and the mean closure they expand to."""
+    fanout = {}
+    for src in graph.nodes():
+        for label, dsts in graph.label_edges(src).items():
+            stats = fanout.setdefault(label, {"edges": 0, "sources": 0, "max_targets": 0, "closure_sum": 0})
+            stats["edges"] += len(dsts)
+            stats["sources"] += 1
+            stats["max_targets"] = max(stats["max_targets"], len(dsts))
+            stats["closure_sum"] += sum(len(graph.closure(dst)) for dst in dsts)
+    for stats in fanout.values():
+        stats["mean_closure"] = round(stats.pop("closure_sum") / stats["edges"], 3)
+    return fanout
+
+
+def profile_reachability(graph):
+    """Nodes the start cannot reach, and reachable nodes that cannot reach an end node."""
+    reached = {graph.start_node}
+    stack = [graph.start_node]
+    reverse = {}
+    for src in graph.nodes():
+        for dst, _ in graph.edges(src):
+            reverse.setdefault(dst, set()).add(src)
+    while stack:
+        for dst, _ in graph.edges(stack.pop()):
+            if dst not in reached:
+                reached.add(dst)
+                stack.append(dst)
+
+    alive = set(graph._end)
+    stack = list(alive)
+    while stack:
+        for src in reverse.get(stack.pop(), ()):
+            if src not in alive:
+                alive.add(src)
+                stack.append(src)
+
+    unreachable = sorted(graph.node_name(node) for node in graph.nodes() if node not in reached)
+    dead = sorted(graph.node_name(node) for node in reached if node not in alive)
+    return {"unreachable_count": len(unreachable), "unreachable": unreachable, "dead_count": len(dead), "dead": dead}
+
+
+def walk_costs(graph, walks, length, seed):
+    """
+    Heads and per-event work along random walks that pick uniformly among the
+    calls the current heads allow. Work counts the heads scanned plus the
+    closure nodes merged into the new head set, i.e. what one lazy NFA step touches.
+    """
+    rng = random.Random(seed)
+    start = graph.start_heads()
+    heads_seen, work_seen = [], []
+    for _ in range(walks):
+        heads = start
+        for _ in range(length):
+            labels = sorted(graph.labels_from(heads))
+            if not labels:
+                break
+            moved = graph.move(heads, rng.choice(labels))
+            work_seen.append(len(heads) + sum(len(graph.closure(node)) for node in moved))
+            heads = graph.closure_of(moved)
+            heads_seen.append(len(heads))
+    return distribution(heads_seen), distribution(work_seen)
+
+
+def policy_bytes(graph, path=None):
+    """Size of the compiled artifact, exact for a --policy input, computed as exportPolicy lays it out otherwise."""
+    if path and path.endswith(".policy"):
+        return os.path.getsize(path)
+    labels = {label for node in graph.nodes() for _, label in graph.edges(node)}
+    num_nodes, num_edges = graph.num_nodes(), graph.num_edges()
+    # one closure per epsilon cycle, i.e. per distinct closure
+    closures = {graph.closure(node) for node in graph.nodes()}
+    closure_words = num_nodes + len(closures) + 1 + sum(len(closure) for closure in closures)
+    blob = sum(len(name.encode()) for name in graph.nodes()) + sum(len(label.encode()) for label in labels)
+    return (POLICY_HEADER.size + 4 * ((num_nodes + 1) * 3 + 2 * num_edges + len(graph._end) + closure_words + len(labels) + 1)
+            + blob)
+
+
+def profile_policy(path, function_map=None, max_dfa_states=65536, walks=100, walk_length=200, seed=0, top=20):
+    graph = PolicyGraph(path) if path.endswith(".policy") else Graph(dot_file=path)
+    if function_map is None:
+        function_map = {label: i + 1 for i, label in enumerate(sorted(graph.alphabet()))}
+    cgraph = converter_graph(graph) if ConverterGraph is not None else None
+
+    closure, local_closure, functions = profile_closures(graph, cgraph, top)
+    expected_heads, expected_work = walk_costs(graph, walks, walk_length, seed)
+
+    dfa = DFA(graph, function_map, max_states=max_dfa_states, minimize=False)
+    # head counts of the unminimized subset states are exact, minimization keeps only the largest per block
+    worst_heads = max(dfa.head_counts) if dfa.complete else None
+    subset_states = dfa.num_states() if dfa.complete else None
+    if dfa.complete:
+        dfa.minimize()
+
+    memory = {
+        "graph_bytes": graph_bytes(graph),
+        "dfa_bytes": deep_size([dfa.table, dfa.accepting, dfa.head_counts, dfa.state_heads, dfa.state_ids]) if dfa.complete else None,
+        "converter_bytes": deep_size([cgraph._graph, cgraph._nodes]) if cgraph is not None else None,
+        "policy_bytes": policy_bytes(graph, path),
+        "bpf_transitions_bytes": len(dfa.table) * BPF_TRANSITION_BYTES if dfa.complete else None,
+        "bitset_bytes": None,
+    }
+    if np is not None:
+        bitset = BitsetNFA(graph, function_map)
+        memory["bitset_bytes"] = sum(m.srcs.nbytes + m.indptr.nbytes + m.indices.nbytes for m in bitset.matrices.values())
+
+    return {
+        "policy": os.path.basename(path),
+        "nodes": graph.num_nodes(),
+        "edges": graph.num_edges(),
+        "epsilon_edges": sum(len(graph.epsilon_edges(node)) for node in graph.nodes()),
+        "alphabet": len(graph.alphabet()),
+        "closure": closure,
+        "local_closure": local_closure,
+        "functions": functions,
+        "fanout": profile_fanout(graph),
+        "reachability": profile_reachability(graph),
+        "heads": {"worst_case": worst_heads, "expected": expected_heads},
+        "work": {"expected": expected_work},
+        "dfa": {"complete": dfa.complete, "subset_states": subset_states,
+                "states": dfa.num_states() if dfa.complete else None, "transitions": len(dfa.table)},
+        "memory": memory,
+    }
+
+
+def lookup(report, dotted):
+    for key in dotted.split("."):
+        if not isinstance(report, dict):
+            return None
+        report = report.get(key)
+    return report
+
+
+def regressions(report, baseline, tolerance):
+    """
+    (metric, old, new) for every gated metric that grew by more than
+    tolerance or lost its value, and every gated flag that was cleared.
+    """
+    found = []
+    for metric in GATED_METRICS:
+        old, new = lookup(baseline, metric), lookup(report, metric)
+        if old is None:
+            continue
+        if new is None or new > old * (1 + tolerance):
+            found.append((metric, old, new))
+    for flag in GATED_FLAGS:
+        old, new = lookup(baseline, flag), lookup(report, flag)
+        if old and not new:
+            found.append((flag, old, new))
+    return found
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Static enforcement cost profile of a policy, as JSON")
+    policy_group = parser.add_mutually_exclusive_group(required=True)
+    policy_group.add_argument("--dot-file", type=str, help="graph.dot written by txtToDotConvert.py.")
+    policy_group.add_argument("--policy", type=str, help="graph.policy written by txtToDotConvert.py.")
+    parser.add_argument("--function-map", type=str, default=None,
+                        help="Function map (library_functions.txt); by default every policy label gets an ID.")
+    parser.add_argument("--max-dfa-states", type=int, default=65536, help="Upper bound on determinized states.")
+    parser.add_argument("--walks", type=int, default=100, help="Random walks estimating the expected heads and work (default: 100).")
+    parser.add_argument("--walk-length", type=int, default=200, help="Calls per random walk (default: 200).")
+    parser.add_argument("--seed", type=int, default=0, help="Random walk seed, fixed so reports diff cleanly (default: 0).")
+    parser.add_argument("--top", type=int, default=20, help="States with the largest closures to list (default: 20).")
+    parser.add_argument("--output", type=str, default=None, help="Write the report here instead of stdout.")
+    parser.add_argument("--baseline", type=str, default=None,
+                        help="Report of the previous policy version; exit with status 1 if a gated metric regressed.")
+    parser.add_argument("--tolerance", type=float, default=0.1,
+                        help="Relative growth of a gated metric allowed against --baseline (default: 0.1).")
+    args = parser.parse_args()
+
+    function_map = None
+    if args.function_map:
+        function_map, _ = DataLoader(args.function_map, None).get_lib_function_map()
+    report = profile_policy(args.policy or args.dot_file, function_map, args.max_dfa_states,
+                            args.walks, args.walk_length, args.seed, args.top)
+
+    text = json.dumps(report, indent=2, sort_keys=True) + "\n"
+    if args.output:
+        with open(args.output, "w") as fp:
+            fp.write(text)
+    else:
+        sys.stdout.write(text)
+
+    if args.baseline:
+        with open(args.baseline) as fp:
+            baseline = json.load(fp)
+        found = regressions(report, baseline, args.tolerance)
+        for metric, old, new in found:
+            print(f"regression: {metric} {old} -> {new}", file=sys.stderr)
+        if found:
+            sys.exit(1)
@@ -0,0 +1,188 @@
+import os
+import time
+import ctypes
+import struct
+from concurrent.futures import ThreadPoolExecutor
+
+from bcc import BPF, lib
+from tqdm import tqdm
+
+from bpf_cache import elf_build_id
+
+BPF_PROBE_ENTRY = 0
+BPF_PROBE_RETURN = 1
+PT_LOAD = 1
+
+
+class AttachReport:
+    """What bulk_attach attached, what it skipped and why, and how long it took."""
+    def __init__(self):
+        self.attached = []
+        self.skipped = {}
+        self.offsets = {}
+        self.elapsed = 0.0
+
+    def summary(self):
+        return f"Attached {len(self.attached)} functions, skipped {len(self.skipped)} in {self.elapsed:.2f}s"
+
+    def to_dict(self):
+        return {"attached": self.attached, "skipped": self.skipped, "elapsed": self.elapsed}
+
+
+def load_segments(path):
+    """Return (p_vaddr, p_offset, p_filesz) of every PT_LOAD segment of an ELF64 file."""
+    segments = []
+    with open(path, "rb") as fp:
+        header = fp.read(64)
+        if header[:4] != b"\x7fELF" or header[4] != 2:
+            raise ValueError(f"{path} is not an ELF64 file")
+        endian = "<" if header[5] == 1 else ">"
+        phoff, = struct.unpack_from(endian + "Q", header, 32)
+        phentsize, phnum = struct.unpack_from(endian + "HH", header, 54)
+        fp.seek(phoff)
+        table = fp.read(phentsize * phnum)
+        for i in range(phnum):
+            p_type, _, p_offset, p_vaddr, _, p_filesz = struct.unpack_from(endian + "IIQQQQ", table, i * phentsize)
+            if p_type == PT_LOAD:
+                segments.append((p_vaddr, p_offset, p_filesz))
+    return segments
+
+
+def vaddr_to_offset(segments, vaddr):
+    for p_vaddr, p_offset, p_filesz in segments:
+        if p_vaddr <= vaddr < p_vaddr + p_filesz:
+            return vaddr - p_vaddr + p_offset
+    return None
+
+
+def resolve_symbol_addresses(path, names):
+    """Map each of names to its symbol address in path, walking the symbol table once."""
+    wanted = set(names)
+    addresses = {}
+    for name, addr in BPF.get_user_functions_and_addresses(path, ".*"):
+        name = name.decode() if isinstance(name, bytes) else name
+        if name in wanted and name not in addresses:
+            addresses[name] = addr
+    return addresses
+
+
+def load_symbol_index(index_path, path, names):
+    """
+    Map each of names to its address in path from an index written by
+    scripts/extract.py. Raises ValueError if path is not in the index or was
+    rebuilt since (build ID mismatch).
+    """
+    real_path = os.path.realpath(path)
+    build_id = elf_build_id(real_path) or "-"
+    wanted = set(names)
+    addresses = {}
+    found = False
+    section = None
+    with open(index_path, "r") as fp:
+        for line in fp:
+            if line.startswith("# library "):
+                library, library_id = line[len("# library "):].rsplit(None, 1)
+                section = library == real_path
+                if section:
+                    found = True
+                    if library_id != build_id:
+                        raise ValueError(f"{index_path} was built for another version of {real_path}")
+            elif section:
+                address, _, _, _, name, _ = line.split()
+                if name in wanted and name not in addresses:
+                    addresses[name] = int(address, 16)
+    if not found:
+        raise ValueError(f"{real_path} is not listed in {index_path}")
+    return addresses
+
+
+def resolve_offsets(path, functions, symbol_addresses=None):
+    """
+    Resolve every function to its file offset in path. Returns (offsets, skipped)
+    where skipped maps a name to the reason it could not be resolved.
+    """
+    if symbol_addresses is None:
+        symbol_addresses = resolve_symbol_addresses(path, functions)
+
+    segments = load_segments(path)
+    offsets, skipped = {}, {}
+    for func in functions:
+        if func not in symbol_addresses:
+            skipped[func] = "symbol not found"
+            continue
+        offset = vaddr_to_offset(segments, symbol_addresses[func])
+        if offset is None:
+            skipped[func] = "address outside loadable segments"
+            continue
+        offsets[func] = offset
+    return offsets, skipped
+
+
+def _attach_batch(bpf, path, batch, entry_fd, exit_fd):
+    kinds = [(b"p", BPF_PROBE_ENTRY, entry_fd)]
+    if exit_fd is not None:
+        kinds.append((b"r", BPF_PROBE_RETURN, exit_fd))
+    results = []
+    for func, offset in batch:
+        probes = []
+        for prefix, attach_type, prog_fd in kinds:
+            ev_name = bpf._get_uprobe_evname(prefix, path, offset, -1)
+            fd = lib.bpf_attach_uprobe(prog_fd, attach_type, ev_name, path, offset, -1, 0)
+            if fd < 0:
+                break
+            probes.append((ev_name, fd))
+        error = None
+        if len(probes) != len(kinds):
+            # an entry probe without its return probe would unbalance the nesting depth
+            error = os.strerror(ctypes.get_errno())
+            for ev_name, fd in probes:
+                lib.bpf_close_perf_event_fd(fd)
+                lib.bpf_detach_uprobe(ev_name)
+            probes = []
+        results.append((func, probes, error))
+    return results
+
+
+def bulk_attach(bpf, path, functions, entry_fn, exit_fn, symbol_addresses=None, batch_size=256, workers=1, progress=True):
+    """
+    Attach entry_fn/exit_fn as uprobe/uretprobe to every function of path,
+    exit_fn may be None to attach entry probes only.
+
+    Offsets are resolved up front, so attaching is one perf_event_open per
+    probe with no per-probe ELF lookup. With workers > 1 batches are attached
+    from a thread pool (ctypes drops the GIL across the attach syscalls).
+    """
+    report = AttachReport()
+    start = time.monotonic()
+    path = path.encode() if isinstance(path, str) else path
+    offsets, report.skipped = resolve_offsets(path, functions, symbol_addresses)
+    entry_fd = bpf.load_func(entry_fn, BPF.KPROBE).fd
+    exit_fd = bpf.load_func(exit_fn, BPF.KPROBE).fd if exit_fn else None
+
+    items = list(offsets.items())
+    batches = [items[i:i + batch_size] for i in range(0, len(items), batch_size)]
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as pool:
+        futures = [pool.submit(_attach_batch, bpf, path, batch, entry_fd, exit_fd) for batch in batches]
+        for future in tqdm(futures, desc="Attaching probes", disable=not progress):
+            for func, probes, error in future.result():
+                for ev_name, fd in probes:
+                    bpf.uprobe_fds[ev_name] = fd
+                if error is None:
+                    report.attached.append(func)
+                    report.offsets[func] = offsets[func]
+                else:
+                    report.skipped[func] = error
+    report.elapsed = time.monotonic() - start
+    return report
+
+
+def bulk_detach(bpf, path, offsets):
+    """Remove the probes bulk_attach placed at offsets of path."""
+    path = path.encode() if isinstance(path, str) else path
+    for offset in offsets:
+        for prefix in (b"p", b"r"):
+            ev_name = bpf._get_uprobe_evname(prefix, path, offset, -1)
+            fd = bpf.uprobe_fds.pop(ev_name, None)
+            if fd is not None:
+                lib.bpf_close_perf_event_fd(fd)
+                lib.bpf_detach_uprobe(ev_name)
@@ -0,0 +1,219 @@
+# Return site of a call_ edge without one recorded (policies from older
+# converters): any ret_ edge matches it.
+ANY_RETURN = None
+
+
+class StateOverflow(RuntimeError):
+    """A state grew past max_states configurations."""
+
+
+class Frame:
+    """
+    Pending call on a return stack: the return site it was pushed for and
+    the frames below it. Stacks of one state share their frames, a frame
+    with several parents stands for all of their stacks, and recursion
+    entered between two library calls makes a frame its own ancestor.
+    """
+    __slots__ = ("site", "parents", "depth")
+
+    def __init__(self, site, depth):
+        self.site = site
+        self.parents = set()
+        self.depth = depth
+
+
+# Bottom of a stack cut off at max_depth: returns through it are matched as
+# loosely as the lazy NFA does and leave it in place.
+TRUNCATED = Frame(ANY_RETURN, 0)
+TRUNCATED.parents.add(TRUNCATED)
+
+
+class PushdownNFA:
+    """
+    Graph matcher that pairs ret_ edges with the call_ edge that entered the function.
+
+    The lazy NFA follows every ret_<f> edge as epsilon, so after a shared
+    callee the heads spread to the return site of every caller. Here a state
+    is a set of (node, frame) configurations, frame being the top of the
+    return stack (None when empty): a call_<f>@<node> edge pushes its return
+    node and a ret_<f> edge is only followed to the frame's return node.
+
+    Calls that return before the next library call never reach a state.
+    Their effect is summarized by saturation: for every function entry, the
+    nodes it reaches at its own level, with a call that can return followed
+    straight to its return site. A closure only pushes frames for calls
+    still pending at the next library call, one frame per call site and
+    step, so recursion adds a cycle instead of a stack per depth. A push
+    onto frames of max_depth earlier steps puts it on TRUNCATED instead, and
+    a return on an empty stack is matched loosely. A state of more than
+    max_states configurations raises StateOverflow. Steps are memoized like
+    DFA's fallback cache. Exposes the same stepping interface as DFA.
+    """
+    complete = False
+
+    def __init__(self, graph, function_map, max_depth=32, max_states=65536):
+        self.graph = graph
+        self.function_map = function_map
+        self.max_depth = max_depth
+        self.max_states = max_states
+        # function ID -> labels, aliases of one libc address can share an ID
+        self._labels = {}
+        for label, func_id in function_map.items():
+            self._labels.setdefault(func_id, []).append(label)
+        self._cache = {}
+
+        # epsilon edges by kind: plain successors, (entry, return site) calls, return targets
+        self._plain, self._calls, self._rets = {}, {}, {}
+        for src in graph.nodes():
+            for dst, label in graph.epsilon_edges(src):
+                if label.startswith("call_"):
+                    _, at, site = label.partition("@")
+                    self._calls.setdefault(src, []).append((dst, graph.node_key(site) if at else ANY_RETURN))
+                elif label.startswith("ret_"):
+                    self._rets.setdefault(src, []).append(dst)
+                else:
+                    self._plain.setdefault(src, []).append(dst)
+
+        self._summaries, self._returns = self.saturate()
+        self._levels = dict(self._summaries)
+        self.end = graph._end[0] if graph._end else None
+        self.start = self.closure([(graph.start_node, None)])
+
+    def saturate(self):
+        """
+        Same-level reach of every function entry and the return sites its
+        ret_ edges lead to, computed together to a fixed point so mutually
+        recursive functions see each other's returns.
+        """
+        entries = {entry for calls in self._calls.values() for entry, _ in calls}
+        reach = {entry: {entry} for entry in entries}
+        returns = {entry: set() for entry in entries}
+        waiting = {entry: [] for entry in entries}
+        work = [(entry, entry) for entry in entries]
+
+        def add(entry, node):
+            if node not in reach[entry]:
+                reach[entry].add(node)
+                work.append((entry, node))
+
+        while work:
+            entry, node = work.pop()
+            for dst in self._plain.get(node, ()):
+                add(entry, dst)
+            for callee, site in self._calls.get(node, ()):
+                waiting[callee].append((entry, site))
+                for ret in list(returns[callee]):
+                    if site is ANY_RETURN or site == ret:
+                        add(entry, ret)
+            for ret in self._rets.get(node, ()):
+                if ret not in returns[entry]:
+                    returns[entry].add(ret)
+                    for caller, site in waiting[entry]:
+                        if site is ANY_RETURN or site == ret:
+                            add(caller, ret)
+        return ({entry: frozenset(nodes) for entry, nodes in reach.items()},
+                {entry: frozenset(rets) for entry, rets in returns.items()})
+
+    def level(self, node):
+        """Nodes reachable from node without leaving its level, calls that can return followed to their return site."""
+        if node in self._levels:
+            return self._levels[node]
+        reached = {node}
+        work = [node]
+        while work:
+            curr = work.pop()
+            nexts = list(self._plain.get(curr, ()))
+            for callee, site in self._calls.get(curr, ()):
+                nexts.extend(ret for ret in self._returns[callee] if site is ANY_RETURN or site == ret)
+            for dst in nexts:
+                if dst not in reached:
+                    reached.add(dst)
+                    work.append(dst)
+        if len(self._levels) >= self.max_states + len(self._summaries):
+            self._levels = dict(self._summaries)
+        self._levels[node] = frozenset(reached)
+        return self._levels[node]
+
+    def push(self, pushed, site, frame):
+        """Frame for a call at site on top of frame, shared by every push of site in this closure."""
+        fresh = frame is not None and pushed.get(frame.site) is frame
+        if not fresh and frame is not None and frame.depth >= self.max_depth:
+            frame = TRUNCATED
+        top = pushed.get(site)
+        if top is None:
+            top = pushed[site] = Frame(site, 1)
+        if not fresh and frame is not None:
+            top.depth = max(top.depth, frame.depth + 1)
+        top.parents.add(frame)
+        return top
+
+    def closure(self, seeds):
+        """Epsilon closure of the (node, frame) configurations seeds."""
+        pushed = {}
+        configs = set()
+        work = list(seeds)
+        seen = set(work)
+        while work:
+            node, frame = work.pop()
+            for curr in self.level(node):
+                configs.add((curr, frame))
+                nexts = []
+                for callee, site in self._calls.get(curr, ()):
+                    nexts.append((callee, self.push(pushed, site, frame)))
+                # returns within this closure are summarized, only frames of earlier steps are popped;
+                # a return on an empty stack is matched loosely
+                if frame is None:
+                    nexts.extend((ret, None) for ret in self._rets.get(curr, ()))
+                elif pushed.get(frame.site) is not frame:
+                    for ret in self._rets.get(curr, ()):
+                        if frame.site is ANY_RETURN or frame.site == ret:
+                            nexts.extend((ret, parent) for parent in frame.parents)
+                for nxt in nexts:
+                    if nxt not in seen:
+                        seen.add(nxt)
+                        work.append(nxt)
+            if len(configs) > self.max_states:
+                raise StateOverflow(f"pushdown state grew past {self.max_states} configurations, raise --max-dfa-states")
+        # frames pushed in one step share a depth, chains between them are bounded by the call sites
+        depth = max((top.depth for top in pushed.values()), default=0)
+        for top in pushed.values():
+            top.depth = depth
+        return frozenset(configs)
+
+    def initial_state(self):
+        return self.start
+
+    def step(self, state, func_id):
+        """Return the configurations reached on func_id, or None if the call is not allowed."""
+        key = (state, func_id)
+        if key in self._cache:
+            return self._cache[key]
+        seeds = set()
+        for label in self._labels.get(func_id, ()):
+            for node, frame in state:
+                for dst in self.graph.label_edges(node).get(label, ()):
+                    seeds.add((dst, frame))
+        target = self.closure(seeds) if seeds else None
+        if len(self._cache) >= self.max_states:
+            self._cache.clear()
+        self._cache[key] = target
+        return target
+
+    def heads(self, state):
+        return {node for node, _ in state}
+
+    def state_of(self, heads):
+        """State at heads with an empty return stack, so returns are matched loosely; None on StateOverflow."""
+        try:
+            return self.closure([(node, None) for node in heads])
+        except StateOverflow:
+            return None
+
+    def is_accepting(self, state):
+        return self.end is not None and any(node == self.end for node, _ in state)
+
+    def head_count(self, state):
+        return len(state)
+
+    def num_states(self):
+        return len(self._cache)
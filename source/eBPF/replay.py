@@ -0,0 +1,149 @@
+import sys
+import time
+import random
+import argparse
+
+from enforce_NFA_ebpf import (
+    DataLoader, Graph, PolicyGraph, DFA, EBPFTracer, EVENT_FORMAT, TRACE_MAGIC,
+    EVENT_DUMMY, EVENT_LIBC, EVENT_EXIT,
+)
+from audit_log import AuditLog, LOG_LEVELS
+from bitset_nfa import BitsetNFA
+from pushdown_nfa import PushdownNFA, StateOverflow
+
+
+def read_trace(path, chunk_records=4096):
+    """Yield decoded events from a file written by enforce_NFA_ebpf.py --record."""
+    with open(path, "rb") as fp:
+        if fp.read(len(TRACE_MAGIC)) != TRACE_MAGIC:
+            raise ValueError(f"{path} is not a recorded trace")
+        while True:
+            chunk = fp.read(EVENT_FORMAT.size * chunk_records)
+            if not chunk:
+                break
+            yield from EVENT_FORMAT.iter_unpack(chunk[:len(chunk) - len(chunk) % EVENT_FORMAT.size])
+
+
+def write_trace(path, events):
+    with open(path, "wb") as fp:
+        fp.write(TRACE_MAGIC)
+        for event in events:
+            fp.write(EVENT_FORMAT.pack(*event))
+
+
+def synthetic_trace(graph, function_map, num_events, num_pids=1, violation_rate=0.0, seed=0):
+    """
+    Random walk over the policy producing dummy/libc event pairs, interleaved
+    across num_pids processes. With probability violation_rate a step uses a
+    call the policy does not allow, which ends that process.
+    """
+    rng = random.Random(seed)
+    ids = sorted(function_map.values())
+    heads = {}
+    next_pid = 1000
+    events = []
+    ts = 0
+    while len(events) < num_events:
+        if len(heads) < num_pids:
+            heads[next_pid] = graph.start_heads()
+            next_pid += 1
+        pid = rng.choice(list(heads))
+        labels = sorted(label for label in graph.labels_from(heads[pid]) if label in function_map)
+        ts += 1000
+        if not labels:
+            events.append((ts, pid, pid, EVENT_EXIT, 1, 0, 0))
+            del heads[pid]
+            continue
+        if rng.random() < violation_rate:
+            allowed = {function_map[label] for label in labels}
+            disallowed = [func_id for func_id in ids if func_id not in allowed]
+            if disallowed:
+                func_id = rng.choice(disallowed)
+                events.append((ts, pid, pid, EVENT_DUMMY, 0, func_id, 0))
+                events.append((ts + 10, pid, pid, EVENT_LIBC, func_id, 0, 0))
+                events.append((ts + 20, pid, pid, EVENT_EXIT, 1, 0, 0))
+                del heads[pid]
+                continue
+        label = rng.choice(labels)
+        func_id = function_map[label]
+        events.append((ts, pid, pid, EVENT_DUMMY, 0, func_id, 0))
+        events.append((ts + 10, pid, pid, EVENT_LIBC, func_id, 0, 0))
+        heads[pid] = graph.closure_of(graph.move(heads[pid], label))
+    return events[:num_events]
+
+
+class ReplayTracer(EBPFTracer):
+    """EBPFTracer fed from a recorded or synthetic trace instead of BPF; kills are only counted."""
+    def __init__(self, graph, function_map, dfa, audit=None, batch_verify=False, syscall_only=False):
+        rev_function_map = {func_id: name for name, func_id in function_map.items()}
+        super().__init__(graph, None, [], function_map, rev_function_map, dfa, audit=audit, batch_verify=batch_verify,
+                         syscall_only=syscall_only)
+        self.kills = 0
+
+    def kill_process(self, pid):
+        self.kills += 1
+
+    def replay(self, events, batch_size=4096):
+        if not self.batch_verify:
+            for event in events:
+                self.handle_event(*event)
+            return
+        batch = []
+        for event in events:
+            batch.append(event)
+            if len(batch) == batch_size:
+                self.verify_batch(batch)
+                batch = []
+        self.verify_batch(batch)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay a recorded or synthetic event trace through the enforcer without BCC")
+    policy_group = parser.add_mutually_exclusive_group(required=True)
+    policy_group.add_argument("--dot-file", type=str, help="Path to the DOT file representing the graph.")
+    policy_group.add_argument("--policy", type=str, help="Path to the compiled policy written by txtToDotConvert.py.")
+    parser.add_argument("--function-map", type=str, required=True, help="Path to the function map file (e.g., library_functions.txt).")
+    parser.add_argument("--trace", type=str, default=None, help="Trace written by enforce_NFA_ebpf.py --record.")
+    parser.add_argument("--synthetic", type=int, default=0, help="Generate this many synthetic events instead of reading --trace.")
+    parser.add_argument("--pids", type=int, default=1, help="Concurrent processes in the synthetic trace (default: 1).")
+    parser.add_argument("--violation-rate", type=float, default=0.0, help="Probability of a disallowed call per synthetic step.")
+    parser.add_argument("--save-trace", type=str, default=None, help="Write the synthetic trace to this file.")
+    parser.add_argument("--engine", type=str, default="dfa", choices=["dfa", "bitset", "pushdown"], help="Policy matcher (default: dfa).")
+    parser.add_argument("--max-call-depth", type=int, default=32, help="Return stack depth of --engine pushdown (default: 32).")
+    parser.add_argument("--syscall-only", action="store_true", help="Verify on the dummy() events and ignore libc events, as enforce_NFA_ebpf.py --syscall-only.")
+    parser.add_argument("--max-dfa-states", type=int, default=65536, help="Upper bound on determinized states.")
+    parser.add_argument("--log-level", type=str, default="debug", choices=list(LOG_LEVELS), help="Audit records to print (default: debug).")
+    parser.add_argument("--log-format", type=str, default="text", choices=["text", "json"], help="Audit record format (default: text).")
+    parser.add_argument("--quiet", action="store_true", help="Suppress audit output, same as --log-level off.")
+    args = parser.parse_args()
+
+    graph = PolicyGraph(args.policy) if args.policy else Graph(dot_file=args.dot_file)
+    if graph.elided and not args.syscall_only:
+        parser.error("the policy was built with --elide-dummies, replay it with --syscall-only")
+    function_map, _ = DataLoader(args.function_map, None).get_lib_function_map()
+    if args.engine == "bitset":
+        dfa = BitsetNFA(graph, function_map)
+    elif args.engine == "pushdown":
+        try:
+            dfa = PushdownNFA(graph, function_map, max_depth=args.max_call_depth, max_states=args.max_dfa_states)
+        except StateOverflow as e:
+            parser.error(str(e))
+    else:
+        dfa = DFA(graph, function_map, max_states=args.max_dfa_states)
+
+    if args.trace:
+        events = list(read_trace(args.trace))
+    elif args.synthetic:
+        events = synthetic_trace(graph, function_map, args.synthetic, args.pids, args.violation_rate)
+        if args.save_trace:
+            write_trace(args.save_trace, events)
+    else:
+        parser.error("one of --trace or --synthetic is required")
+
+    audit = AuditLog(sys.stdout, level="off" if args.quiet else args.log_level, fmt=args.log_format)
+    tracer = ReplayTracer(graph, function_map, dfa, audit, batch_verify=args.engine == "bitset", syscall_only=args.syscall_only)
+    start = time.perf_counter()
+    tracer.replay(events)
+    elapsed = time.perf_counter() - start
+    tracer.close()
+    print(f"Replayed {len(events)} events in {elapsed:.3f}s ({len(events) / max(elapsed, 1e-9):.0f} events/sec), {tracer.kills} kills", file=sys.stderr)
@@ -0,0 +1,151 @@
+import queue
+import multiprocessing
+
+from enforce_NFA_ebpf import EBPFTracer, EVENT_FORMAT, EVENT_FORK, EVENT_EXIT
+from audit_log import AuditLog, LOG_LEVELS
+
+
+class QueueAudit(AuditLog):
+    """AuditLog of a worker: records go back to the reader, which writes them."""
+    def __init__(self, results, level="info"):
+        super().__init__(None, level)
+        self.results = results
+
+    def enabled(self, level):
+        return LOG_LEVELS[level] >= self.level
+
+    def log(self, level, event, **fields):
+        if self.enabled(level):
+            self.results.put(("audit", level, event, fields))
+
+
+class ShardTracer(EBPFTracer):
+    """EBPFTracer of one worker process; kills are requested from the reader."""
+    def __init__(self, graph, function_map, rev_function_map, dfa, results, level, batch_verify, syscall_only, history_len):
+        super().__init__(graph, None, [], function_map, rev_function_map, dfa, audit=QueueAudit(results, level),
+                         batch_verify=batch_verify, syscall_only=syscall_only, history_len=history_len)
+        self.results = results
+
+    def kill_process(self, pid):
+        self.results.put(("kill", pid))
+
+    def resolve_libc_base(self, pid):
+        """Done by the reader, see EBPFTracer.observe_shipped."""
+
+
+def run_worker(graph, function_map, rev_function_map, dfa, level, batch_verify, syscall_only, history_len, inbox, results):
+    tracer = ShardTracer(graph, function_map, rev_function_map, dfa, results, level, batch_verify, syscall_only, history_len)
+    while True:
+        message = inbox.get()
+        if message is None:
+            return
+        kind, payload = message
+        if kind == "events":
+            events = list(EVENT_FORMAT.iter_unpack(payload))
+            if batch_verify:
+                tracer.verify_batch(events)
+            else:
+                for event in events:
+                    tracer.handle_event(*event)
+        elif kind == "policy":
+            old_dfa = tracer.dfa
+            tracer.graph, tracer.dfa = payload
+            mapped, reset = tracer.remap_processes(old_dfa, tracer.dfa)
+            tracer.audit.info("policy_remap", mapped=mapped, reset=reset)
+
+
+class ShardPool:
+    """
+    Worker processes that each own the automaton state of a set of pids.
+
+    The reader (the tracer's poll loop) routes every drained record to the
+    shard of its pid and sends each shard one message per batch. A forked
+    child is placed in its parent's shard, so the inherited state is local
+    and a process tree stays in order on one queue. Kill requests and audit
+    records come back on a single result queue. The automaton state of a
+    shard only lives in its worker, so a worker that dies cannot be replaced:
+    sending to it raises RuntimeError.
+    """
+    def __init__(self, num_workers, graph, function_map, rev_function_map, dfa, level="info",
+                 batch_verify=False, syscall_only=False, max_queue=64, history_len=1024, put_timeout=1.0):
+        context = multiprocessing.get_context("spawn")
+        self.results = context.Queue()
+        self.inboxes = [context.Queue(maxsize=max_queue) for _ in range(num_workers)]
+        self.workers = [
+            context.Process(target=run_worker, daemon=True,
+                            args=(graph, function_map, rev_function_map, dfa, level, batch_verify, syscall_only, history_len,
+                                  inbox, self.results))
+            for inbox in self.inboxes
+        ]
+        for worker in self.workers:
+            worker.start()
+        self.put_timeout = put_timeout
+        self.shards = {}
+
+    def shard_of(self, pid, tid, kind, func_id):
+        if kind == EVENT_FORK:
+            shard = self.shards.setdefault(func_id, func_id % len(self.workers))
+            self.shards[pid] = shard
+        elif kind == EVENT_EXIT and func_id:
+            shard = self.shards.pop(pid, pid % len(self.workers))
+        else:
+            shard = self.shards.setdefault(pid, pid % len(self.workers))
+        return shard
+
+    def put(self, shard, message):
+        """Queue message for shard, waiting while its queue is full and its worker is alive."""
+        while True:
+            try:
+                self.inboxes[shard].put(message, timeout=self.put_timeout)
+                return
+            except queue.Full:
+                if not self.workers[shard].is_alive():
+                    raise RuntimeError(f"verification worker {shard} exited with code {self.workers[shard].exitcode}")
+
+    def submit(self, records, observe=None):
+        """
+        Route raw records to their shards, blocking while a shard's queue is
+        full so the ring buffer applies backpressure. observe, if given, is
+        called with every decoded event.
+        """
+        batches = [[] for _ in self.workers]
+        for record in records:
+            event = EVENT_FORMAT.unpack(record)
+            if observe:
+                observe(event)
+            _, pid, tid, kind, func_id, _, _ = event
+            batches[self.shard_of(pid, tid, kind, func_id)].append(record)
+        for shard, batch in enumerate(batches):
+            if batch:
+                self.put(shard, ("events", b"".join(batch)))
+
+    def results_ready(self):
+        """Yield the kill requests and audit records sent back so far."""
+        while True:
+            try:
+                yield self.results.get_nowait()
+            except queue.Empty:
+                return
+
+    def reload(self, graph, dfa):
+        for shard in range(len(self.workers)):
+            self.put(shard, ("policy", (graph, dfa)))
+
+    def dead_workers(self):
+        return [i for i, worker in enumerate(self.workers) if not worker.is_alive()]
+
+    def close(self, timeout=5.0):
+        """Stop the workers; dead ones are skipped and ones that do not stop within timeout are terminated."""
+        for inbox, worker in zip(self.inboxes, self.workers):
+            try:
+                if worker.is_alive():
+                    inbox.put(None, timeout=timeout)
+            except queue.Full:
+                pass
+        for inbox, worker in zip(self.inboxes, self.workers):
+            worker.join(timeout)
+            if worker.is_alive():
+                worker.terminate()
+                worker.join(timeout)
+            # nobody reads the queue any more, do not wait on its feeder thread at exit
+            inbox.cancel_join_thread()
@@ -13,6 +13,12 @@
 #include "llvm/IR/InstrTypes.h"     // For CallInst class
 #include "llvm/IR/IRBuilder.h"
 #include "llvm/IR/Function.h"
+#include "llvm/Support/CommandLine.h"
+#include "llvm/Support/FileSystem.h"
+#include "llvm/Support/Path.h"
+#include "llvm/Support/xxhash.h"
+#include "llvm/ADT/SmallString.h"
+#include "llvm/ADT/StringExtras.h"
 
 #include <map>
 #include <set>
@@ -22,6 +28,10 @@
 
 using namespace llvm;
 
+// -mllvm -enfa-stream : append every automaton of the translation unit to a single
+// <source>.<path hash>.enfa file instead of writing one ENFA_<func>.txt per function
+static cl::opt<bool> ENFAStream("enfa-stream", cl::desc("Write all automata of a translation unit to one <source>.<path hash>.enfa stream"), cl::init(false));
+
 namespace {
   struct CallGraphPass : public FunctionPass {
     static char ID;
@@ -29,9 +39,40 @@ namespace {
     std::map<void*, uint64_t> bbID;
     std::map<uint64_t, std::vector<std::pair<uint64_t, std::string>>> graph;
     std::set<uint64_t> outDeg;
+    std::ofstream streamFile;
 
     CallGraphPass() : FunctionPass(ID) {}
 
+    virtual bool doInitialization(Module &M) {
+      if (ENFAStream) {
+        // the file name carries a hash of the absolute source path, so a/util.c and b/util.c
+        // get streams of their own; the first line names the source to catch hash collisions
+        SmallString<256> source(M.getSourceFileName());
+        sys::fs::make_absolute(source);
+        std::string path = sys::path::filename(source).str() + "." + utohexstr(xxHash64(source.str())) + ".enfa";
+        std::string header = "# source " + source.str().str();
+        std::ifstream existing(path);
+        std::string firstLine;
+        if (existing && std::getline(existing, firstLine) && firstLine.rfind("# source ", 0) == 0 && firstLine != header) {
+          errs() << "ENFA stream " << path << " belongs to " << firstLine.substr(9) << ", not overwriting it with "
+                 << source << "\n";
+          return false;
+        }
+        streamFile.open(path, std::ios::trunc);
+        if (!streamFile)
+          errs() << "Could not open the ENFA stream for writing: " << path << "\n";
+        else
+          streamFile << header << "\n";
+      }
+      return false;
+    }
+
+    virtual bool doFinalization(Module &) {
+      if (streamFile.is_open())
+        streamFile.close();
+      return false;
+    }
+
     virtual bool runOnFunction(Function &Func) {
       gID = 1;
       graph.clear();
@@ -99,6 +140,9 @@ namespace {
         if (callInst == nullptr) continue;
         Function *calledFunction = callInst->getCalledFunction();
         if (calledFunction == nullptr) continue;
+        // dummy() is inserted by DummyCallAddPass and not part of the policy; skipping it
+        // also keeps call site numbers (the node a call edge enters) the same with or without it
+        if (calledFunction->getName() == "dummy") continue;
 
         if(calledFunction->getName().str() == func.getName().str()){
           start = end;
@@ -117,6 +161,18 @@ namespace {
     }
 
     void to_epsillon_DFA(Function& func, uint64_t start, uint64_t endState, std::map<uint64_t, std::vector<std::pair<uint64_t, std::string>>> &graph){
+      if (streamFile.is_open()) {
+        // record header "@ <func> <start> <end> <edge count>", then the same edge lines as ENFA_<func>.txt
+        size_t numEdges = 0;
+        for (auto &item : graph)
+          numEdges += item.second.size();
+        streamFile << "@ " << func.getName().str() << " " << start << " " << endState << " " << numEdges << "\n";
+        for (auto &item : graph) {
+          for (auto &e : item.second)
+            streamFile << func.getName().str() << "," << item.first << "," << e.first << "," << e.second << "\n";
+        }
+        return;
+      }
       std::ofstream outfile("ENFA_"+ func.getName().str() +".txt");  //, std::ios_base::app);
       outfile << start << "\n";
       outfile << endState << "\n";
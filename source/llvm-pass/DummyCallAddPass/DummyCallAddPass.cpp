@@ -13,6 +13,7 @@
 #include "llvm/IR/InstrTypes.h"     // For CallInst class
 #include "llvm/IR/IRBuilder.h"
 #include "llvm/IR/Function.h"
+#include "llvm/Support/CommandLine.h"
 
 #include <map>
 #include <set>
@@ -22,12 +23,19 @@
 
 using namespace llvm;
 
+// -mllvm -dummy-elide=<file> : call sites listed by txtToDotConvert.py --elide-dummies
+// ("<function> <site> <label>" lines) get no dummy() call
+static cl::opt<std::string> DummyElide("dummy-elide", cl::desc("File of call sites whose dummy() call is redundant"), cl::init(""));
+
 namespace {
   struct DummyCallAddPass : public FunctionPass {
     static char ID;
     const std::string libc_function = std::string(__FILE__).substr(0, std::string(__FILE__).find_last_of("/\\")) + "/library_functions.txt";
     std::map<std::string, uint32_t> libc_func;
     std::set<std::string> fname; 
+    std::set<std::pair<std::string, uint64_t>> elided;
+    uint64_t numInserted = 0;
+    uint64_t numElided = 0;
 
     DummyCallAddPass() : FunctionPass(ID) {
       std::ifstream inFile(libc_function);
@@ -37,11 +45,12 @@ namespace {
       }
       std::string element;
       uint32_t elementId;
-      for(int i = 0; i < 2671; i++){
-          inFile >> element >> elementId;
+      while (inFile >> element >> elementId) {
           libc_func.insert({element, elementId});
       }
       inFile.close();
+      if (!DummyElide.empty())
+        deserializeElided(DummyElide);
     }
 
     virtual bool doInitialization(Module &)  {
@@ -50,8 +59,10 @@ namespace {
       return false; 
     }
 
-    virtual bool doFinalization(Module &) { 
+    virtual bool doFinalization(Module &M) { 
       serializeSet("called_lib_functions.txt");
+      if (!DummyElide.empty())
+        errs() << M.getSourceFileName() << ": inserted " << numInserted << " dummy() calls, elided " << numElided << "\n";
       return false; 
     }
 
@@ -63,16 +74,27 @@ namespace {
       IRBuilder<> builder(context);
       FunctionCallee dummySyscallFunc = Func.getParent()->getOrInsertFunction("dummy", Type::getInt32Ty(context), Type::getInt32Ty(context));
       std::string values;
+      // call sites are numbered as CallGraphPass numbers the nodes its call edges enter:
+      // after the basic blocks, one per direct call in program order
+      uint64_t site = Func.size();
       for (auto &BB : Func) {
           for (auto &I : BB) {
               auto *callInst = dyn_cast<CallInst>(&I);
-              if (callInst && callInst->getCalledFunction() && libc_func.find(callInst->getCalledFunction()->getName().str()) != libc_func.end()) {
+              if (!callInst || !callInst->getCalledFunction() || callInst->getCalledFunction()->getName() == "dummy")
+                  continue;
+              site++;
+              if (libc_func.find(callInst->getCalledFunction()->getName().str()) != libc_func.end()) {
+                  fname.insert(callInst->getCalledFunction()->getName().str());
+                  if (elided.count({Func.getName().str(), site})) {
+                      numElided++;
+                      continue;
+                  }
                   builder.SetInsertPoint(&BB, std::next(BB.getFirstInsertionPt()));
                   Value *value = builder.getInt32(libc_func[callInst->getCalledFunction()->getName().str()]);
                   builder.SetInsertPoint(callInst);
                   builder.CreateCall(dummySyscallFunc, {value});
                   values = callInst->getCalledFunction()->getName().str() + " return \n";
-                  fname.insert(callInst->getCalledFunction()->getName().str());
+                  numInserted++;
               }
           }
       }
@@ -90,6 +112,20 @@ namespace {
       outFile.close();
     }
 
+    void deserializeElided(const std::string& filename) {
+      std::ifstream inFile(filename);
+      if (!inFile) {
+          errs() << "Could not open the file for reading: " << filename << "\n";
+          return;
+      }
+
+      std::string function, label;
+      uint64_t site;
+      while (inFile >> function >> site >> label)
+          elided.insert({function, site});
+      inFile.close();
+    }
+
     void deserializeSet(const std::string& filename) {
       std::ifstream inFile(filename);
       if (!inFile) {